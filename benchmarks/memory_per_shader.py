@@ -0,0 +1,48 @@
+"""
+Measures memory used by a loaded material with 10k variants, per shader, with `tracemalloc`.
+Material is memory mapped, so the file itself isn't counted.
+"""
+
+import argparse
+import gc
+import os
+import tempfile
+import tracemalloc
+
+from lazurite.material import Material
+
+from synthetic import make_material, write_material
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--variants", type=int, default=3334, help="Variants per pass")
+    parser.add_argument("--code-size", type=int, default=120)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "Memory.material.bin")
+        write_material(
+            make_material(args.variants, code_size=args.code_size, seed=1), path
+        )
+
+        for lazy in (False, True):
+            gc.collect()
+            tracemalloc.start()
+            material = Material.load_bin_file(path, memory_map=True, lazy=lazy)
+            memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+
+            variant_count = sum(len(p.variants) for p in material.passes)
+            shader_count = sum(
+                len(v.shaders) for p in material.passes for v in p.variants
+            )
+            print(
+                f"lazy={lazy}: {variant_count} variants, {shader_count} shaders, "
+                f"{memory / 1e6:.1f} MB, {memory / shader_count:.0f} B/shader"
+            )
+            del material
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Measures encoding and decoding time of minimal json (merge source format) with `Material.serialize_minimal`
+and `Material.load_minimal`, on a material with many flags and variants.
+"""
+
+import argparse
+import itertools
+import json
+import time
+
+from lazurite.material import Material
+from lazurite.material.platform import ShaderPlatform
+from lazurite.material.stage import ShaderStage
+from lazurite.material.shader_pass import Pass
+from lazurite.material.shader_pass.variant import Variant
+from lazurite.material.shader_pass.shader_definition import ShaderDefinition
+from lazurite.material.shader_pass.shader_input import (
+    ShaderInput,
+    InputType,
+    InputSemantic,
+)
+
+
+def make_input(index: int):
+    shader_input = ShaderInput()
+    shader_input.name = f"v_{index}"
+    shader_input.type = InputType(index % 4)
+    shader_input.semantic = InputSemantic(7, index % 8)
+    return shader_input
+
+
+def make_material(variant_count: int, flag_count: int):
+    material = Material()
+    for pass_name in ("A", "B"):
+        shader_pass = Pass()
+        shader_pass.name = pass_name
+        combinations = itertools.product(*[["Off", "On", "X"]] * flag_count)
+        for n, values in enumerate(itertools.islice(combinations, variant_count)):
+            variant = Variant()
+            variant.flags = {f"Flag{i}": value for i, value in enumerate(values)}
+            for platform in (ShaderPlatform.ESSL_310, ShaderPlatform.Metal):
+                for stage in (ShaderStage.Vertex, ShaderStage.Fragment):
+                    shader = ShaderDefinition()
+                    shader.platform = platform
+                    shader.stage = stage
+                    shader.inputs = [make_input(i) for i in range(n % 7, n % 7 + 8)]
+                    variant.shaders.append(shader)
+            shader_pass.variants.append(variant)
+        material.passes.append(shader_pass)
+    return material
+
+
+def best_time(function, repeat: int):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--variants", type=int, default=5000, help="Variants per pass")
+    parser.add_argument("--flags", type=int, default=24)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    material = make_material(args.variants, args.flags)
+    shader_count = sum(len(v.shaders) for p in material.passes for v in p.variants)
+    serialize_time = best_time(material.serialize_minimal, args.repeat)
+    obj = json.loads(json.dumps(material.serialize_minimal()))
+    load_time = best_time(lambda: Material().load_minimal(obj), args.repeat)
+
+    print(
+        f"{args.variants * 2} variants x {args.flags} flags, {shader_count} shaders: "
+        f"serialize_minimal {serialize_time:.2f} s, load_minimal {load_time:.2f} s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Checks that the built-in boolean minimizer produces the same macro conditions as `sympy.simplify_logic`
+on random expressions, and compares their time. Requires sympy (`pip install lazurite[sympy]`).
+"""
+
+import argparse
+import random
+import sys
+import time
+
+import lazurite.material  # Imported first, like in the CLI, to resolve circular imports.
+from lazurite.decompiler.macro_decompiler import expression_processing
+from lazurite.decompiler.macro_decompiler.expression_search import (
+    ExpressionSearchToken,
+    JoinType,
+)
+
+FLAG_NAMES = ["pass", "f_Fancy", "f_Mode", "Inst", "f_B", "f_C", "f_Seasons"]
+FLAG_VALUES = ["On", "Off", "X", "Y", "Z"]
+
+
+def make_token_list(r: random.Random, flag_count: int, max_tokens: int):
+    flags = [(r.choice(FLAG_NAMES), r.choice(FLAG_VALUES)) for _ in range(flag_count)]
+    tokens = []
+    for i in range(r.randint(1, max_tokens)):
+        token = ExpressionSearchToken()
+        token.flag_name, token.flag_value = r.choice(flags)
+        token.is_negative = r.random() < 0.4
+        token.join_type = (
+            JoinType.Initial
+            if i == 0
+            else r.choice([JoinType.And, JoinType.Or, JoinType.Group])
+        )
+        tokens.append(token)
+    return tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--count", type=int, default=2000)
+    parser.add_argument("--max-flags", type=int, default=8)
+    parser.add_argument("--max-tokens", type=int, default=12)
+    args = parser.parse_args()
+
+    r = random.Random(args.seed)
+    token_lists = [
+        make_token_list(r, r.randint(1, args.max_flags), args.max_tokens)
+        for _ in range(args.count)
+    ]
+    token_lists.append([])
+
+    start = time.perf_counter()
+    conditions, macros = expression_processing.process_expressions(token_lists)
+    native_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    sympy_conditions, sympy_macros = expression_processing.process_sympy_expressions(
+        [
+            expression_processing.convert_to_sympy_expression(tokens)
+            for tokens in token_lists
+        ]
+    )
+    sympy_time = time.perf_counter() - start
+
+    mismatches = [
+        (condition, sympy_condition)
+        for condition, sympy_condition in zip(conditions, sympy_conditions)
+        if condition != sympy_condition
+    ]
+    print(
+        f"{len(token_lists)} expressions, {len(mismatches)} mismatches, "
+        f"macros {'equal' if macros == sympy_macros else 'different'}, "
+        f"native {native_time:.2f} s, sympy {sympy_time:.2f} s"
+    )
+    for condition, sympy_condition in mismatches[:5]:
+        print(f"  native: {condition}\n  sympy:  {sympy_condition}")
+
+    if mismatches or macros != sympy_macros:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
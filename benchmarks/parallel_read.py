@@ -0,0 +1,104 @@
+"""
+Compares sequential and parallel (`max_workers`) reading of a synthetic material,
+and breaks parallel reading down into its phases: skipping passes to find their bounds,
+decoding them, and pickling and unpickling the decoded passes between processes.
+"""
+
+import argparse
+import io
+import os
+import pickle
+import tempfile
+import time
+
+from lazurite import util
+from lazurite.material import Material
+from lazurite.material.shader_pass import Pass
+
+from synthetic import make_material, write_material
+
+
+def best_time(function, repeat: int):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--variants", type=int, default=1500)
+    parser.add_argument("--code-size", type=int, default=3000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "Parallel.material.bin")
+        write_material(
+            make_material(args.variants, code_size=args.code_size, seed=1), path
+        )
+        with open(path, "rb") as f:
+            data = f.read()
+
+        for lazy in (False, True):
+            sequential_time, _ = best_time(
+                lambda: Material.load_bin_file(path, memory_map=True, lazy=lazy),
+                args.repeat,
+            )
+            parallel_time, material = best_time(
+                lambda: Material.load_bin_file(
+                    path, memory_map=True, lazy=lazy, max_workers=args.workers
+                ),
+                args.repeat,
+            )
+            output = io.BytesIO()
+            material.write(output)
+            assert output.getvalue() == data, "Parallel read changed the material"
+            del material
+
+            header = Material()
+            file = util.MemoryReader(data)
+            header._read_header(file)
+            file = header._decrypt(file)
+            header._read_properties(file)
+            position = file.tell()
+
+            def skip():
+                file.seek(position)
+                bounds = []
+                for _ in range(util.read_ushort(file)):
+                    start = file.tell()
+                    Pass.skip(file, header.version)
+                    bounds.append((start, file.tell()))
+                return bounds
+
+            skip_time, bounds = best_time(skip, args.repeat)
+            pass_datas = [bytes(file.buffer[start:end]) for start, end in bounds]
+            decode_time, passes = best_time(
+                lambda: [
+                    Pass().read(util.MemoryReader(pass_data), header.version, lazy)
+                    for pass_data in pass_datas
+                ],
+                args.repeat,
+            )
+            pickle_time, pickled = best_time(
+                lambda: [pickle.dumps(shader_pass) for shader_pass in passes],
+                args.repeat,
+            )
+            unpickle_time, _ = best_time(
+                lambda: [pickle.loads(blob) for blob in pickled], args.repeat
+            )
+
+            print(
+                f"lazy={lazy}: sequential {sequential_time * 1e3:.0f} ms, "
+                f"parallel ({args.workers}) {parallel_time * 1e3:.0f} ms | "
+                f"skip {skip_time * 1e3:.0f} ms, decode {decode_time * 1e3:.0f} ms, "
+                f"pickle {pickle_time * 1e3:.0f} ms, unpickle {unpickle_time * 1e3:.0f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
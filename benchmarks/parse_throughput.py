@@ -0,0 +1,45 @@
+"""
+Measures decoding time of a single shader definition, by reading all shaders of a synthetic material
+from one buffer with `ShaderDefinition.read`.
+"""
+
+import argparse
+import io
+import time
+
+from lazurite import util
+from lazurite.material.shader_pass.shader_definition import ShaderDefinition
+
+from synthetic import make_material
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--variants", type=int, default=1500)
+    parser.add_argument("--code-size", type=int, default=3000)
+    parser.add_argument("--repeat", type=int, default=25)
+    args = parser.parse_args()
+
+    material = make_material(args.variants, code_size=args.code_size, seed=1)
+    buffer = io.BytesIO()
+    shader_count = 0
+    for shader_pass in material.passes:
+        for variant in shader_pass.variants:
+            for shader in variant.shaders:
+                shader.write(buffer, material.version)
+                shader_count += 1
+    data = buffer.getvalue()
+
+    best_time = float("inf")
+    for _ in range(args.repeat):
+        reader = util.MemoryReader(data)
+        start = time.perf_counter()
+        for _ in range(shader_count):
+            ShaderDefinition().read(reader, material.version)
+        best_time = min(best_time, time.perf_counter() - start)
+
+    print(f"{shader_count} shaders, {best_time / shader_count * 1e6:.2f} us/shader")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Synthetic materials for benchmarks, since vanilla materials can't be shipped with the repository.
+"""
+
+import random
+
+from lazurite.material import Material
+from lazurite.material.platform import ShaderPlatform
+from lazurite.material.stage import ShaderStage
+from lazurite.material.shader_pass import Pass
+from lazurite.material.shader_pass.variant import Variant
+from lazurite.material.shader_pass.shader_definition import ShaderDefinition
+from lazurite.material.shader_pass.bgfx_shader import BgfxShader, BgfxUniform
+from lazurite.material.shader_pass.shader_input import (
+    ShaderInput,
+    InputType,
+    InputSemantic,
+)
+
+FLAG_DOMAIN = {
+    "Fancy": ["Off", "On"],
+    "Seasons": ["Off", "On"],
+    "Inst": ["Off", "On"],
+    "Mode": ["A", "B", "C"],
+}
+
+
+def make_material(
+    variant_count: int,
+    platforms=(ShaderPlatform.ESSL_310, ShaderPlatform.Metal),
+    code_size=200,
+    seed=0,
+    name="Synthetic",
+) -> Material:
+    """
+    Returns a material with 3 passes (two graphics passes and a compute pass) of `variant_count` variants each,
+    with a shader of `code_size` bytes for every platform and stage.
+    """
+    r = random.Random(seed)
+    material = Material()
+    material.name = name
+
+    inputs = []
+    for i in range(5):
+        shader_input = ShaderInput()
+        shader_input.name = f"in{i}"
+        shader_input.type = InputType(i % 4)
+        shader_input.semantic = InputSemantic(7, i)
+        inputs.append(shader_input)
+
+    for pass_name in ("Opaque", "Transparent", "Compute"):
+        shader_pass = Pass()
+        shader_pass.name = pass_name
+        shader_pass.flag_domain = {
+            key: list(values) for key, values in FLAG_DOMAIN.items()
+        }
+        stages = (
+            (ShaderStage.Compute,)
+            if pass_name == "Compute"
+            else (ShaderStage.Vertex, ShaderStage.Fragment)
+        )
+        for variant_index in range(variant_count):
+            variant = Variant()
+            variant.is_supported = bool(variant_index % 3)
+            variant.flags = {
+                key: r.choice(values) for key, values in FLAG_DOMAIN.items()
+            }
+            for platform in platforms:
+                for stage in stages:
+                    shader = ShaderDefinition()
+                    shader.platform = platform
+                    shader.stage = stage
+                    shader.inputs = inputs[: r.randint(0, len(inputs))]
+                    shader.hash = r.getrandbits(64)
+
+                    bgfx_shader = BgfxShader()
+                    bgfx_shader.hash = r.getrandbits(32)
+                    for i in range(r.randint(0, 3)):
+                        uniform = BgfxUniform()
+                        uniform.name = f"U{i}"
+                        uniform.type_bits = 2
+                        uniform.count = 1
+                        uniform.reg_index = i
+                        uniform.reg_count = 1
+                        bgfx_shader.uniforms.append(uniform)
+                    if (
+                        platform == ShaderPlatform.Metal
+                        and stage == ShaderStage.Compute
+                    ):
+                        bgfx_shader.group_size = [8, 8, 1]
+                    code = "#version 310 es\n" + "".join(
+                        f"// line {r.randint(0, 3)}\n" for _ in range(code_size // 12)
+                    )
+                    bgfx_shader.shader_bytes = code.encode()
+                    bgfx_shader.size = -1
+                    shader.bgfx_shader = bgfx_shader
+                    variant.shaders.append(shader)
+            shader_pass.variants.append(variant)
+        material.passes.append(shader_pass)
+
+    return material
+
+
+def write_material(material: Material, path: str):
+    with open(path, "wb") as f:
+        material.write(f)
@@ -1,7 +1,11 @@
 import argparse
+import contextlib
+import io
 import time
 import os
+import traceback
 
+from collections.abc import Callable
 from concurrent.futures import ProcessPoolExecutor
 
 from lazurite import util
@@ -10,7 +14,16 @@ from lazurite.material import Material
 from lazurite.material.stage import ShaderStage
 from lazurite.material.platform import ShaderPlatform
 from lazurite.material.encryption import EncryptionType
+from lazurite.material.meta import MetaCompression
 from lazurite.compiler.macro_define import MacroDefine
+from lazurite.decompiler.macro_decompiler import ConditionCache
+from lazurite.decompiler.macro_decompiler.condition_cache import (
+    CACHE_COUNTS,
+    get_cache_report,
+)
+
+# Counters that tasks update, which are merged back from worker processes.
+_TASK_COUNTERS = (util.JSON_LOAD_COUNTS, CACHE_COUNTS)
 
 
 def list_packed_materials(args) -> list[str]:
@@ -57,78 +70,167 @@ def list_unpacked_materials(args):
     return material_folders
 
 
-def unpack(args):
-    for file in list_packed_materials(args):
-        file_name: str = os.path.basename(file)
-        print(file_name)
-
-        material = Material.load_bin_file(file)
-        if args.sort_flags:
-            material.sort_variants()
-
-        # That should keep the project protected legally.
-        skip_shaders = args.skip_shaders
-        if material.encryption != EncryptionType.NONE:
-            print(
-                f"Warning! {material.name} material is encrypted. "
-                "This tool cannot be used to obtain decrypted shaders."
-            )
-            skip_shaders = True
-
-        material.store(
-            file_name.removesuffix(Material.EXTENSION), args.output, skip_shaders
+def _get_input_size(path: str) -> int:
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+
+    size = 0
+    for folder, _, file_names in os.walk(path):
+        for file_name in file_names:
+            size += os.path.getsize(os.path.join(folder, file_name))
+    return size
+
+
+def _run_task(task: Callable, args, path: str):
+    """
+    Runs a single task of a batch, returns its printed output, error traceback and changes of task counters.
+    """
+    counters = [counter.copy() for counter in _TASK_COUNTERS]
+    output = io.StringIO()
+    error = None
+    with contextlib.redirect_stdout(output):
+        try:
+            task(args, path)
+        except Exception:
+            error = traceback.format_exc()
+
+    counter_deltas = [
+        counter - previous for counter, previous in zip(_TASK_COUNTERS, counters)
+    ]
+    return output.getvalue(), error, counter_deltas
+
+
+def run_batch(args, task: Callable, paths: list[str]):
+    """
+    Runs a task for each input path, using up to `--max-workers` processes.
+    Largest inputs are scheduled first, but output of each task is printed in order of input paths.
+    Failed tasks don't stop the others, their errors are printed in place of their output and reported at the end.
+    """
+    failed_paths = []
+
+    def report(path: str, output: str, error: str | None):
+        print(output, end="")
+        if error is not None:
+            print(f'Failed to process "{path}"\n{error}', end="")
+            failed_paths.append(path)
+
+    if args.max_workers == 1 or len(paths) <= 1:
+        for path in paths:
+            output, error, _ = _run_task(task, args, path)
+            report(path, output, error)
+    else:
+        # Roughly sort tasks by complexity (estimated from input size).
+        sizes = {path: _get_input_size(path) for path in paths}
+        with ProcessPoolExecutor(max_workers=args.max_workers or None) as executor:
+            futures = {
+                path: executor.submit(_run_task, task, args, path)
+                for path in sorted(paths, key=sizes.get, reverse=True)
+            }
+            for path in paths:
+                output, error, counter_deltas = futures[path].result()
+                for counter, delta in zip(_TASK_COUNTERS, counter_deltas):
+                    counter.update(delta)
+                report(path, output, error)
+
+    if failed_paths:
+        raise Exception(
+            f"Failed to process {len(failed_paths)} of {len(paths)} inputs: "
+            + ", ".join(failed_paths)
         )
 
 
+def unpack_single_material(args, file: str):
+    file_name: str = os.path.basename(file)
+    print(file_name)
+
+    material = Material.load_bin_file(file, memory_map=True, lazy=True)
+    if args.sort_flags:
+        material.sort_variants()
+
+    # That should keep the project protected legally.
+    skip_shaders = args.skip_shaders
+    if material.encryption != EncryptionType.NONE:
+        print(
+            f"Warning! {material.name} material is encrypted. "
+            "This tool cannot be used to obtain decrypted shaders."
+        )
+        skip_shaders = True
+
+    material.store(
+        file_name.removesuffix(Material.EXTENSION), args.output, skip_shaders
+    )
+
+
+def unpack(args):
+    run_batch(args, unpack_single_material, list_packed_materials(args))
+
+
+def pack_single_material(args, file: str):
+    file_name: str = os.path.basename(os.path.abspath(file)) + Material.EXTENSION
+    print(file_name)
+
+    material = Material()
+    material.load_unpacked_material(file)
+
+    with open(os.path.join(args.output, file_name), "wb") as f:
+        material.write(f)
+
+
 def pack(args):
-    for file in list_unpacked_materials(args):
-        file_name: str = os.path.basename(os.path.abspath(file)) + Material.EXTENSION
-        print(file_name)
+    run_batch(args, pack_single_material, list_unpacked_materials(args))
 
-        material = Material()
-        material.load_unpacked_material(file)
 
-        with open(os.path.join(args.output, file_name), "wb") as f:
-            material.write(f)
+def label_single_material(args, file: str):
+    file_name: str = os.path.basename(file)
+    print(file_name)
 
+    material = Material.load_bin_file(file)
+    material.label()
+    with open(os.path.join(args.output, file_name), "wb") as f:
+        material.write(f)
 
-def label(args):
-    for file in list_packed_materials(args):
-        file_name: str = os.path.basename(file)
-        print(file_name)
 
-        material = Material.load_bin_file(file)
-        material.label()
-        with open(os.path.join(args.output, file_name), "wb") as f:
-            material.write(f)
+def label(args):
+    run_batch(args, label_single_material, list_packed_materials(args))
 
 
-def clear(args):
-    for file in list_packed_materials(args):
-        file_name: str = os.path.basename(file)
-        print(file_name)
+def clear_single_material(args, file: str):
+    file_name: str = os.path.basename(file)
+    print(file_name)
 
-        material = Material.load_bin_file(file)
+    # Material is copied with empty shaders, without loading all of it.
+    with open(os.path.join(args.output, file_name), "wb") as output:
+        Material.transcode_bin_file(file, [(output, None)], clear_shaders=True)
 
-        for shader_pass in material.passes:
-            for variant in shader_pass.variants:
-                for shader in variant.shaders:
-                    shader.bgfx_shader.shader_bytes = bytes()
 
-        material.encryption = EncryptionType.NONE
-        with open(os.path.join(args.output, file_name), "wb") as f:
-            material.write(f)
+def clear(args):
+    run_batch(args, clear_single_material, list_packed_materials(args))
 
 
 def restore_single_material(args, file: str):
     file_name: str = os.path.basename(file)
     print(file_name)
     file_name = file_name.removesuffix(Material.EXTENSION)
-    material = Material.load_bin_file(file)
+    material = Material.load_bin_file(file, memory_map=True, lazy=True)
+
+    with contextlib.ExitStack() as stack:
+        condition_cache = None
+        if not args.no_cache:
+            condition_cache = stack.enter_context(contextlib.closing(ConditionCache()))
+        _restore_material(args, material, file_name, condition_cache)
+
+
+def _restore_material(
+    args, material: Material, file_name: str, condition_cache: ConditionCache | None
+):
+    # Slow search time is shared by the whole material.
+    search_deadline = time.perf_counter() + args.timeout
 
     material.passes.sort(key=lambda x: x.name)
     material.sort_variants()
-    varying = material.restore_varying_def(args.timeout)
+    varying = material.restore_varying_def(
+        args.timeout, condition_cache, args.search_workers
+    )
     if varying:
         with open(os.path.join(args.output, file_name + ".varying.def.sc"), "w") as f:
             f.write(varying)
@@ -151,7 +253,9 @@ def restore_single_material(args, file: str):
         args.split_passes,
         args.merge_stages,
         not args.no_processing,
-        args.timeout,
+        max(search_deadline - time.perf_counter(), 0),
+        condition_cache,
+        args.search_workers,
     )
     for platform, stage, shader_pass, code in shader_codes:
         file_name_tokens = [file_name]
@@ -171,18 +275,7 @@ def restore_single_material(args, file: str):
 
 
 def restore(args):
-    paths = list_packed_materials(args)
-
-    # Roughly sort tasks by complexity (estimated from file size).
-    paths = list(zip(paths, (os.path.getsize(p) for p in paths)))
-    paths.sort(key=lambda f: f[1], reverse=True)
-    paths = [p[0] for p in paths]
-
-    with ProcessPoolExecutor(max_workers=args.max_workers or None) as executor:
-        # Normally, workers will not raise any exceptions during execution
-        # but iterating over results will raise them properly.
-        for _ in executor.map(restore_single_material, [args] * len(paths), paths):
-            pass
+    run_batch(args, restore_single_material, list_packed_materials(args))
 
 
 def build(args):
@@ -233,125 +326,149 @@ def _format_info(obj: list | dict, depth=0) -> str:
     return txt
 
 
-def info(args):
-    for file in list_packed_materials(args):
-        file_name: str = os.path.basename(file)
-        material = Material.load_bin_file(file)
+def info_single_material(args, file: str):
+    file_name: str = os.path.basename(file)
+    material = Material.load_bin_file(file, memory_map=True, lazy=True)
 
-        shader_count = 0
-        for shader_pass in material.passes:
-            for variant in shader_pass.variants:
-                shader_count += len(variant.shaders)
+    shader_count = 0
+    for shader_pass in material.passes:
+        for variant in shader_pass.variants:
+            shader_count += len(variant.shaders)
 
-        material.buffers.sort(key=lambda x: x.register_slot)
-        material.sort_variants()
-        material.passes.sort(key=lambda x: x.name)
-        material.uniforms.sort(key=lambda x: x.name)
-
-        platforms = [p.name for p in material.get_platforms()]
-        platforms.sort()
-        stages = [p.name for p in material.get_stages()]
-        stages.sort()
-
-        passes_object = {}
-        output_bindings_object = {}
-        for shader_pass in material.passes:
-            macro = util.generate_pass_name_macro(shader_pass.name)
-
-            reconstruction = util.reconstruct_fragment_outputs(
-                shader_pass.output_binding_signature
-            )
-
-            if reconstruction is None:
-                fragment_outputs = "Unknown"
-            else:
-                reconstruction.sort()
-                fragment_outputs = ", ".join(reconstruction)
-                fragment_outputs = f"[{fragment_outputs}]"
-            fragment_outputs = f"{fragment_outputs} (Signature = {shader_pass.output_binding_signature})"
-            passes_object[shader_pass.name] = macro
-            output_bindings_object[shader_pass.name] = fragment_outputs
-
-        info = {
-            "Name": material.name,
-            "Format Version": material.version,
-            "Encryption": material.encryption.name,
-            "Parent": material.parent,
-            "Total Shaders": shader_count,
-            "Platforms": platforms,
-            "Stages": stages,
-            "Passes": passes_object,
-            "Fragment Output Bindings": output_bindings_object,
-            "Flags": {
-                key: {v: util.generate_flag_name_macro(key, v) for v in value}
-                for key, value in material.get_flag_definitions().items()
-            },
-            "Buffers": {
-                f"{b.precision.name} {b.type.name} {b.name}{' '+ b.texture_format if b.texture_format else ''}": {
-                    "Register Slot": b.register_slot,
-                    "Binding Slot": b.binding_slot,
-                    "Slot Count": b.slot_count,
-                    "Unordered Access": b.unordered_access,
-                    "Texture Path": b.texture_path,
-                    "Sampler State": (
-                        {
-                            "Texture Filter": b.sampler_state.filter.name,
-                            "Texture Wrap": b.sampler_state.wrapping.name,
-                        }
-                        if b.sampler_state
-                        else ""
-                    ),
-                    "Custom Type Info": (
-                        {
-                            "Struct": b.custom_type_info.struct,
-                            "Size": b.custom_type_info.size,
-                        }
-                        if b.custom_type_info
-                        else ""
-                    ),
-                }
-                for b in material.buffers
-            },
-            "Uniforms": [
-                f"{u.type.name} {u.name}{'['+str(u.count)+']' if u.count > 1 else ''}{(' = [' + ', '.join(str(d) for d in u.default)+']') if u.default else ''}"
-                for u in material.uniforms
-            ],
-            "Uniform Overrides": sorted(
-                [
-                    f"{key}: {value}"
-                    for key, value in material.uniform_overrides.items()
-                ],
-            ),
-        }
-        print(f"#### {file_name} ####")
-        print(_format_info(info))
+    material.buffers.sort(key=lambda x: x.register_slot)
+    material.sort_variants()
+    material.passes.sort(key=lambda x: x.name)
+    material.uniforms.sort(key=lambda x: x.name)
 
+    platforms = [p.name for p in material.get_platforms()]
+    platforms.sort()
+    stages = [p.name for p in material.get_stages()]
+    stages.sort()
 
-def serialize(args):
-    for file in list_packed_materials(args):
-        file_name: str = os.path.basename(file).removesuffix(Material.EXTENSION)
-        print(file_name)
+    passes_object = {}
+    output_bindings_object = {}
+    for shader_pass in material.passes:
+        macro = util.generate_pass_name_macro(shader_pass.name)
 
-        material = Material.load_bin_file(file)
+        reconstruction = util.reconstruct_fragment_outputs(
+            shader_pass.output_binding_signature
+        )
 
-        material.buffers.sort(key=lambda x: x.name)
-        material.uniforms.sort(key=lambda x: x.name)
-        material.passes.sort(key=lambda x: x.name)
-        material.sort_variants()
+        if reconstruction is None:
+            fragment_outputs = "Unknown"
+        else:
+            reconstruction.sort()
+            fragment_outputs = ", ".join(reconstruction)
+            fragment_outputs = f"[{fragment_outputs}]"
+        fragment_outputs = (
+            f"{fragment_outputs} (Signature = {shader_pass.output_binding_signature})"
+        )
+        passes_object[shader_pass.name] = macro
+        output_bindings_object[shader_pass.name] = fragment_outputs
+
+    info = {
+        "Name": material.name,
+        "Format Version": material.version,
+        "Encryption": material.encryption.name,
+        "Parent": material.parent,
+        "Total Shaders": shader_count,
+        "Platforms": platforms,
+        "Stages": stages,
+        "Passes": passes_object,
+        "Fragment Output Bindings": output_bindings_object,
+        "Flags": {
+            key: {v: util.generate_flag_name_macro(key, v) for v in value}
+            for key, value in material.get_flag_definitions().items()
+        },
+        "Buffers": {
+            f"{b.precision.name} {b.type.name} {b.name}{' '+ b.texture_format if b.texture_format else ''}": {
+                "Register Slot": b.register_slot,
+                "Binding Slot": b.binding_slot,
+                "Slot Count": b.slot_count,
+                "Unordered Access": b.unordered_access,
+                "Texture Path": b.texture_path,
+                "Sampler State": (
+                    {
+                        "Texture Filter": b.sampler_state.filter.name,
+                        "Texture Wrap": b.sampler_state.wrapping.name,
+                    }
+                    if b.sampler_state
+                    else ""
+                ),
+                "Custom Type Info": (
+                    {
+                        "Struct": b.custom_type_info.struct,
+                        "Size": b.custom_type_info.size,
+                    }
+                    if b.custom_type_info
+                    else ""
+                ),
+            }
+            for b in material.buffers
+        },
+        "Uniforms": [
+            f"{u.type.name} {u.name}{'['+str(u.count)+']' if u.count > 1 else ''}{(' = [' + ', '.join(str(d) for d in u.default)+']') if u.default else ''}"
+            for u in material.uniforms
+        ],
+        "Uniform Overrides": sorted(
+            [f"{key}: {value}" for key, value in material.uniform_overrides.items()],
+        ),
+    }
+    print(f"#### {file_name} ####")
+    print(_format_info(info))
+
+
+def info(args):
+    run_batch(args, info_single_material, list_packed_materials(args))
 
+
+def serialize_single_material(args, file: str):
+    file_name: str = os.path.basename(file).removesuffix(Material.EXTENSION)
+    print(file_name)
+
+    material = Material.load_bin_file(file, memory_map=True, lazy=True)
+
+    material.buffers.sort(key=lambda x: x.name)
+    material.uniforms.sort(key=lambda x: x.name)
+    material.passes.sort(key=lambda x: x.name)
+    material.sort_variants()
+
+    if args.meta:
+        material.store_meta(file_name, args.output, MetaCompression[args.compression])
+    else:
         material.store_minimal(file_name, args.output)
 
 
-def convert(args):
-    for file in list_packed_materials(args):
-        file_name: str = os.path.basename(file)
-        print(file_name)
+def serialize(args):
+    run_batch(args, serialize_single_material, list_packed_materials(args))
 
-        material = Material.load_bin_file(file)
-        material.version = args.version
 
-        with open(os.path.join(args.output, file_name), "wb") as f:
-            material.write(f)
+def convert_single_material(args, file: str):
+    file_name: str = os.path.basename(file)
+    print(file_name)
+
+    # With multiple versions, each of them is stored in its own subfolder.
+    output_paths = [
+        (
+            os.path.join(args.output, str(version), file_name)
+            if len(args.version) > 1
+            else os.path.join(args.output, file_name)
+        )
+        for version in args.version
+    ]
+    with contextlib.ExitStack() as stack:
+        outputs = []
+        for path, version in zip(output_paths, args.version):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            outputs.append((stack.enter_context(open(path, "wb")), version))
+
+        Material.transcode_bin_file(file, outputs)
+
+
+def convert(args):
+    if not args.version:
+        args.version = [Material.LATEST_VERSION]
+    run_batch(args, convert_single_material, list_packed_materials(args))
 
 
 def main():
@@ -384,7 +501,7 @@ def main():
         "--max-workers",
         type=int,
         default=0,
-        help="Maximum numbers of cores or processes to use during restore or build commands",
+        help="Maximum numbers of cores or processes to use, by default all cores are used",
     )
 
     # Unpack arguments.
@@ -409,7 +526,18 @@ def main():
         "--timeout",
         type=float,
         default=10,
-        help="Maximum time allowed for slow search restoring algorithm, in seconds",
+        help="Maximum time allowed for slow search restoring algorithm per material, in seconds",
+    )
+    group.add_argument(
+        "--search-workers",
+        type=int,
+        default=1,
+        help="Number of processes used for slow search of each material, 0 means all cores",
+    )
+    group.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Don't reuse or store macro conditions in the persistent condition cache",
     )
     group.add_argument(
         "--split-passes",
@@ -485,20 +613,38 @@ def main():
         "--glslang", type=str, default=None, help="glslang validator command"
     )
 
+    # Serialize arguments
+    group = parser.add_argument_group("serialize arguments")
+    group.add_argument(
+        "--meta",
+        action="store_true",
+        help="Generate compact binary .material.meta files instead of json",
+    )
+    group.add_argument(
+        "--compression",
+        choices=[compression.name for compression in MetaCompression],
+        default=MetaCompression.none.name,
+        help="Compression of generated .material.meta files",
+    )
+
     # Convert arguments
     group = parser.add_argument_group("convert arguments")
     group.add_argument(
         "-v",
         "--version",
         type=int,
-        default=Material.LATEST_VERSION,
-        help="Output material format version",
+        action="append",
+        help="Output material format version (latest by default), can be repeated to convert to multiple versions, which are stored in subfolders named after them",
     )
 
     # Execute command.
-    args = parser.parse_args()
+    args = parser.parse_intermixed_args()
     current_time = time.perf_counter()
 
     commands[args.command](args)
 
+    if util.JSON_LOAD_COUNTS:
+        print(util.get_json_load_report())
+    if CACHE_COUNTS.total():
+        print(get_cache_report())
     print(f"Completed in {round(time.perf_counter() - current_time, 2)} seconds")
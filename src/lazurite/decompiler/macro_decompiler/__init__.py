@@ -1 +1,2 @@
 from .macro_decompiler import restore_code, InputVariant
+from .condition_cache import ConditionCache
@@ -0,0 +1,213 @@
+from collections import defaultdict
+
+# Boolean function minimization with the same algorithm and output as `sympy.simplify_logic(expr, force=True)`,
+# so that conditions don't change with or without sympy.
+#
+# Terms are (value, don't care) pairs of bit masks, where variable `i` of `n` is bit `n - 1 - i`,
+# and values have zeros in don't care bits. Minterms are truth table rows, in which function is true,
+# numbered the same way (first variable is the most significant bit).
+
+Term = tuple[int, int]
+
+
+def _simplified_pairs(terms: list[Term], variable_count: int) -> list[Term]:
+    """
+    Combines terms that differ in a single variable into terms with one more don't care bit,
+    until none can be combined (Quine-McCluskey method), and returns resulting prime implicants.
+    """
+    if not terms:
+        return []
+
+    # Terms can only be combined with terms that have one more variable set to 1.
+    groups: defaultdict[int, list[int]] = defaultdict(list)
+    for index, (value, _) in enumerate(terms):
+        groups[value.bit_count()].append(index)
+    term_indices = {term: index for index, term in enumerate(terms)}
+
+    simplified_terms: dict[Term, None] = {}
+    is_combined = [False] * len(terms)
+    for ones in range(variable_count):
+        for i in groups[ones]:
+            value, dont_care = terms[i]
+            pairs: list[tuple[int, int]] = []
+            for bit_index in range(variable_count):
+                bit = 1 << bit_index
+                if (value | dont_care) & bit:
+                    continue
+                j = term_indices.get((value | bit, dont_care))
+                if j is not None:
+                    pairs.append((j, bit))
+
+            for j, bit in sorted(pairs):
+                is_combined[i] = is_combined[j] = True
+                simplified_terms[(value, dont_care | bit)] = None
+
+    result = (
+        _simplified_pairs(list(simplified_terms), variable_count)
+        if simplified_terms
+        else []
+    )
+    result += [term for term, combined in zip(terms, is_combined) if not combined]
+    return result
+
+
+def _iter_bits(mask: int):
+    while mask:
+        low_bit = mask & -mask
+        yield low_bit.bit_length() - 1
+        mask ^= low_bit
+
+
+def _remove_redundancy(primes: list[Term], minterms: list[int]) -> list[Term]:
+    """
+    Chooses prime implicants that cover all minterms, with a prime implicant table,
+    where dominated rows and columns are removed, and a column that covers the most rows is picked when none are.
+    """
+    if not minterms:
+        return []
+
+    # Rows are minterms with masks of primes that cover them, columns are primes with masks of minterms they cover.
+    minterm_indices = {minterm: index for index, minterm in enumerate(minterms)}
+    rows = [0] * len(minterms)
+    columns = [0] * len(primes)
+    for prime_index, (value, dont_care) in enumerate(primes):
+        column = 0
+        if 1 << dont_care.bit_count() <= len(minterms):
+            # Enumerate all subsets of don't care bits.
+            subset = dont_care
+            while True:
+                index = minterm_indices.get(value | subset)
+                if index is not None:
+                    column |= 1 << index
+                if not subset:
+                    break
+                subset = (subset - 1) & dont_care
+        else:
+            for index, minterm in enumerate(minterms):
+                if minterm & ~dont_care == value:
+                    column |= 1 << index
+        columns[prime_index] = column
+        for index in _iter_bits(column):
+            rows[index] |= 1 << prime_index
+
+    def clear(row_index: int, prime_index: int):
+        rows[row_index] &= ~(1 << prime_index)
+        columns[prime_index] &= ~(1 << row_index)
+
+    has_changed = True
+    while has_changed:
+        has_changed = False
+
+        # Remove rows that contain all primes of another row.
+        for row_index, row in enumerate(rows):
+            if not row:
+                continue
+            dominating_rows = -1
+            for prime_index in _iter_bits(row):
+                dominating_rows &= columns[prime_index]
+            dominating_rows &= ~(1 << row_index)
+            for row2_index in _iter_bits(dominating_rows):
+                for prime_index in _iter_bits(rows[row2_index]):
+                    clear(row2_index, prime_index)
+                has_changed = True
+
+        # Remove columns that only cover minterms, which another column covers.
+        for prime_index, column in enumerate(columns):
+            if not column:
+                continue
+            candidates = 0
+            for row_index in _iter_bits(column):
+                candidates |= rows[row_index]
+            candidates &= ~(1 << prime_index)
+            for prime2_index in _iter_bits(candidates):
+                column2 = columns[prime2_index]
+                if column2 and not column2 & ~column:
+                    for row_index in _iter_bits(column2):
+                        clear(row_index, prime2_index)
+                    has_changed = True
+
+        if not has_changed:
+            # Pick the first prime that covers the most minterms (if at least 2) and drop other primes from its rows.
+            counts = [column.bit_count() for column in columns]
+            best_count = max(counts)
+            if best_count > 1:
+                best_index = counts.index(best_count)
+                for row_index in _iter_bits(columns[best_index]):
+                    for prime_index in _iter_bits(rows[row_index]):
+                        if prime_index != best_index:
+                            clear(row_index, prime_index)
+                            has_changed = True
+
+    return [prime for prime, column in zip(primes, columns) if column]
+
+
+# Literals are (variable, is negative) pairs. Expressions are ordered like sympy orders arguments of And and Or,
+# by number of nodes and then by sort key, where only the parts of sort keys that can differ are kept.
+def _get_literal_order(literal: tuple[str, bool]):
+    variable, is_negative = literal
+    symbol_key = ((2, 0, "Symbol"), (1, (variable,)))
+    if is_negative:
+        return 2, ((5, 0, "Not"), (1, (symbol_key,)))
+    return 1, symbol_key
+
+
+def _get_term_order(literals: list[tuple[str, bool]], class_name: str):
+    if len(literals) == 1:
+        return _get_literal_order(literals[0])
+    orders = [_get_literal_order(literal) for literal in literals]
+    return (
+        1 + sum(nodes for nodes, _ in orders),
+        ((5, 0, class_name), (len(orders), tuple(key for _, key in orders))),
+    )
+
+
+def _format_literal(literal: tuple[str, bool]):
+    variable, is_negative = literal
+    return "~" + variable if is_negative else variable
+
+
+def simplify_logic(variables: list[str], minterms: list[int]) -> str:
+    """
+    Returns the simplest sum of products or product of sums of boolean function (whichever sympy would choose),
+    formatted the same way as a string of sympy expression, for example `(a & ~b) | c`.
+    Variables are sorted names, and minterms are sorted truth table rows in which function is true.
+    """
+    variable_count = len(variables)
+    if len(minterms) == 1 << variable_count:
+        return "True"
+    if not minterms:
+        return "False"
+
+    # Sum of products when function is true for at least half of the rows, product of sums otherwise.
+    is_sum = len(minterms) >= 1 << variable_count - 1
+    if not is_sum:
+        minterm_set = set(minterms)
+        minterms = [row for row in range(1 << variable_count) if row not in minterm_set]
+
+    primes = _simplified_pairs([(minterm, 0) for minterm in minterms], variable_count)
+    essential_primes = _remove_redundancy(primes, minterms)
+
+    inner_class, inner_separator = ("And", " & ") if is_sum else ("Or", " | ")
+    outer_separator = " | " if is_sum else " & "
+    terms = []
+    for value, dont_care in essential_primes:
+        literals = [
+            (variable, bool(value >> bit_index & 1) != is_sum)
+            for variable, bit_index in zip(variables, range(variable_count - 1, -1, -1))
+            if not dont_care >> bit_index & 1
+        ]
+        literals.sort(key=_get_literal_order)
+        terms.append((_get_term_order(literals, inner_class), literals))
+    terms.sort(key=lambda term: term[0])
+
+    if len(terms) == 1:
+        return inner_separator.join(_format_literal(l) for l in terms[0][1])
+
+    return outer_separator.join(
+        (
+            _format_literal(literals[0])
+            if len(literals) == 1
+            else "(" + inner_separator.join(map(_format_literal, literals)) + ")"
+        )
+        for _, literals in terms
+    )
@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+import sqlite3
+from collections import Counter
+
+from lazurite import util
+
+CACHE_COUNTS: Counter[str] = Counter()  # Number of cache hits and misses.
+
+
+class ConditionCache:
+    """
+    Persistent cache of macro conditions, stored in an SQLite database.
+
+    Conditions are keyed by truth tables of expression search inputs (see `ExpressionSearchInput.get_key`),
+    so that each distinct condition is only searched for once, across shaders, materials and runs.
+    Only exact conditions are cached, since approximations depend on search timeout.
+    """
+
+    FORMAT_VERSION = 1
+    "Changes whenever expression search or simplification produces different conditions for the same input"
+    FILE_NAME = "conditions.sqlite"
+
+    path: str
+
+    _connection: sqlite3.Connection
+
+    def __init__(self, path: str | None = None) -> None:
+        self.path = path or os.path.join(util.get_cache_dir(), self.FILE_NAME)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+        # Cache can be shared by several processes, which wait for each other's writes.
+        self._connection = sqlite3.connect(self.path, timeout=60)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS conditions (key TEXT PRIMARY KEY, condition TEXT NOT NULL)"
+        )
+        self._connection.commit()
+
+    def _hash_key(self, key: tuple) -> str:
+        return hashlib.sha256(
+            json.dumps([self.FORMAT_VERSION, key], separators=(",", ":")).encode()
+        ).hexdigest()
+
+    def get(self, keys: list[tuple]) -> dict[tuple, str]:
+        """
+        Returns cached conditions of the keys that are in the cache.
+        """
+        if not keys:
+            return {}
+
+        conditions: dict[tuple, str] = {}
+        for key in keys:
+            row = self._connection.execute(
+                "SELECT condition FROM conditions WHERE key = ?", (self._hash_key(key),)
+            ).fetchone()
+            if row is not None:
+                conditions[key] = row[0]
+
+        CACHE_COUNTS["hits"] += len(conditions)
+        CACHE_COUNTS["misses"] += len(keys) - len(conditions)
+        return conditions
+
+    def put(self, conditions: dict[tuple, str]):
+        """
+        Adds conditions to the cache.
+        """
+        if not conditions:
+            return
+
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO conditions (key, condition) VALUES (?, ?)",
+                [
+                    (self._hash_key(key), condition)
+                    for key, condition in conditions.items()
+                ],
+            )
+
+    def close(self):
+        self._connection.close()
+
+
+def get_cache_report() -> str:
+    """
+    Returns a summary of condition cache hits and misses.
+    """
+    hits = CACHE_COUNTS["hits"]
+    total = hits + CACHE_COUNTS["misses"]
+    if not total:
+        return "No macro conditions were looked up in cache"
+    return f"Found {hits} of {total} macro conditions in cache ({hits / total:.0%} hit rate)"
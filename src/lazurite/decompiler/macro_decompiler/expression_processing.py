@@ -1,4 +1,3 @@
-import sympy
 import re
 
 from lazurite import util
@@ -9,23 +8,36 @@ from .expression_search import (
     ExpressionSearchOutput,
     ExpressionSearchInput,
 )
+from .boolean_minimizer import simplify_logic
+
+
+def get_token_macro(token: ExpressionSearchToken) -> str:
+    """
+    Returns name of the macro that expression token checks.
+    """
+    if token.flag_name == "pass":
+        return util.generate_pass_name_macro(token.flag_value)
+
+    # TODO: refactor and/or better document the f_ thing
+    if token.flag_name.startswith("f_"):
+        flag_name = token.flag_name.removeprefix("f_")
+        return util.generate_flag_name_macro(flag_name, token.flag_value)
+
+    return util.format_definition_name(token.flag_name + token.flag_value)
 
 
 def convert_to_sympy_expression(tokens: list[ExpressionSearchToken]):
+    """
+    Converts expression tokens into a sympy expression. Requires optional sympy dependency.
+    """
+    # Sympy takes seconds to import, so it's only imported when it's used.
+    import sympy
+
     expression: sympy.Symbol = sympy.false
+    previous_groups: sympy.Symbol = sympy.false
 
     for token in tokens:
-        if token.flag_name == "pass":
-            macro = util.generate_pass_name_macro(token.flag_value)
-        else:
-            # TODO: refactor and/or better document the f_ thing
-            if token.flag_name.startswith("f_"):
-                flag_name = token.flag_name.removeprefix("f_")
-                macro = util.generate_flag_name_macro(flag_name, token.flag_value)
-            else:
-                macro = util.format_definition_name(token.flag_name + token.flag_value)
-
-        macro: sympy.Symbol = sympy.symbols(macro)
+        macro: sympy.Symbol = sympy.symbols(get_token_macro(token))
 
         if token.is_negative:
             macro = ~macro
@@ -36,8 +48,53 @@ def convert_to_sympy_expression(tokens: list[ExpressionSearchToken]):
             expression = expression & macro
         elif token.join_type is JoinType.Or:
             expression = expression | macro
+        elif token.join_type is JoinType.Group:
+            previous_groups = previous_groups | expression
+            expression = macro
+
+    return previous_groups | expression
+
+
+def get_truth_table(tokens: list[ExpressionSearchToken]) -> tuple[list[str], list[int]]:
+    """
+    Returns sorted names of macros in expression tokens, along with rows of truth table in which expression is true.
+    Rows are numbered by macro values, where the first macro is the most significant bit.
+    """
+    macros = [get_token_macro(token) for token in tokens]
+    variables = sorted(set(macros))
+    row_count = 1 << len(variables)
+
+    # Expression is evaluated for all rows at once, each row is a bit in a mask.
+    full_mask = (1 << row_count) - 1
+    variable_masks: dict[str, int] = {}
+    for i, variable in enumerate(variables):
+        period = 1 << len(variables) - 1 - i
+        # Variable is 0 in the first half of each period and 1 in the second half.
+        pattern = ((1 << period) - 1) << period
+        mask = 0
+        for start in range(0, row_count, period * 2):
+            mask |= pattern << start
+        variable_masks[variable] = mask
+
+    expression = 0
+    previous_groups = 0
+    for token, macro in zip(tokens, macros):
+        mask = variable_masks[macro]
+        if token.is_negative:
+            mask ^= full_mask
+
+        if token.join_type is JoinType.Initial:
+            expression = mask
+        elif token.join_type is JoinType.And:
+            expression &= mask
+        elif token.join_type is JoinType.Or:
+            expression |= mask
+        elif token.join_type is JoinType.Group:
+            previous_groups |= expression
+            expression = mask
+    expression |= previous_groups
 
-    return expression
+    return variables, [row for row in range(row_count) if expression >> row & 1]
 
 
 def _format_expression(expr: str):
@@ -49,13 +106,78 @@ def _format_expression(expr: str):
     return expr
 
 
-def process_sympy_expressions(expressions: list[sympy.Symbol]):
+def _get_macro_condition(expression: str, macros: set[str]) -> str:
+    """
+    Converts stringified simplified expression into macro condition string.
+    """
+    if len(macros) == 1:
+        # Special case handling of macro expressions with only 1 defined macro
+        if expression.startswith("~"):
+            return "#ifndef " + expression.removeprefix("~")
+        return "#ifdef " + expression
+    return "#if " + _format_expression(expression)
+
+
+def _get_expression_macros(expression: str) -> set[str]:
+    # Constant expressions are treated as a single macro, same as in sympy.
+    return set(re.findall(r"\w+", expression))
+
+
+def process_expressions(
+    token_lists: list[list[ExpressionSearchToken]], verify=False
+) -> tuple[list[str], set[str]]:
+    """
+    Simplifies expression token lists and converts them into macro condition strings,
+    returns them along with a set of macros that were referenced in simplified expressions.
+
+    Results are the same as from `process_sympy_expressions`, with `verify` they are checked against it
+    (requires optional sympy dependency).
+    """
+    macros: set[str] = set()
+    conditions: list[str] = []
+
+    # Expressions with the same truth table are only simplified once.
+    truth_table_conditions: dict[tuple, str] = {}
+    for tokens in token_lists:
+        variables, minterms = get_truth_table(tokens)
+        key = (tuple(variables), tuple(minterms))
+        condition = truth_table_conditions.get(key)
+        if condition is None:
+            expression = simplify_logic(variables, minterms)
+            expression_macros = _get_expression_macros(expression)
+            macros.update(expression_macros)
+            condition = _get_macro_condition(expression, expression_macros)
+            truth_table_conditions[key] = condition
+        conditions.append(condition)
+
+    if verify:
+        sympy_conditions, sympy_macros = process_sympy_expressions(
+            [convert_to_sympy_expression(tokens) for tokens in token_lists]
+        )
+        if sympy_conditions != conditions or sympy_macros != macros:
+            raise Exception(
+                "Simplified macro conditions don't match sympy: "
+                + ", ".join(
+                    f'"{condition}" instead of "{sympy_condition}"'
+                    for condition, sympy_condition in zip(conditions, sympy_conditions)
+                    if condition != sympy_condition
+                )
+            )
+
+    return conditions, macros
+
+
+def process_sympy_expressions(expressions: list):
     """
     Processes a list of sympy expressions. The following logic is executed:
     - Simplifies sympy expressions
     - Converts simplified expressions into macro condition strings
     - Creates a set of macros that were referenced in simplified expressions
+
+    Requires optional sympy dependency, `process_expressions` gives the same results without it.
     """
+    import sympy
+
     macros: set[str] = set()
     unique_results: list[str] = []
     unique_expressions = list(set(expressions))
@@ -63,24 +185,25 @@ def process_sympy_expressions(expressions: list[sympy.Symbol]):
     # Operate on unique expressions, in order to reduce compute workload (simplify_logic compute time grows exponentially)
     for expression in unique_expressions:
         expression = sympy.simplify_logic(expression, force=True)
-        macro_condition = str(expression)
-        macros.update(str(s) for s in expression.atoms())
-        if len(expression.atoms()) == 1:
-            # Special case handling of macro expressions with only 1 defined macro
-            if macro_condition.startswith("~"):
-                macro_condition = "#ifndef " + macro_condition.removeprefix("~")
-            else:
-                macro_condition = "#ifdef " + macro_condition
-        else:
-            macro_condition = "#if " + _format_expression(macro_condition)
-
-        unique_results.append(macro_condition)
+        expression_macros = {str(s) for s in expression.atoms()}
+        macros.update(expression_macros)
+        unique_results.append(_get_macro_condition(str(expression), expression_macros))
 
     return [
         unique_results[unique_expressions.index(expr)] for expr in expressions
     ], macros
 
 
+def get_condition_macros(macro_condition: str) -> set[str]:
+    """
+    Returns a set of macros that are referenced in macro condition string.
+    """
+    line = macro_condition.splitlines()[-1]
+    if line.startswith(("#ifdef ", "#ifndef ")):
+        return {line.split()[1]}
+    return set(re.findall(r"defined\((\w+)\)", line))
+
+
 def mark_approximated_results(
     macro_conditionals: list[str],
     search_results: list[ExpressionSearchOutput],
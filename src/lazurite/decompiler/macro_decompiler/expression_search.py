@@ -1,4 +1,8 @@
+import contextlib
+import os
 import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from enum import Enum, auto
 from copy import copy
 
@@ -30,6 +34,30 @@ class ExpressionSearchInput:
             self.flags == value.flags and self.flag_definition == value.flag_definition
         )
 
+    def _get_point(self, flags: ShaderFlags) -> tuple[FlagValue | None, ...]:
+        return tuple(flags.get(flag_name, None) for flag_name in self.flag_definition)
+
+    def get_key(self) -> tuple:
+        """
+        Returns a hashable truth table of the input: its flag definition and the number of each outcome for every combination of flag values.
+        Flags that are not in the flag definition are left out, since search results don't depend on them.
+        """
+        counts = Counter(
+            (outcome, self._get_point(flags)) for outcome, flags in self.flags
+        )
+        return (
+            tuple(
+                (name, tuple(values)) for name, values in self.flag_definition.items()
+            ),
+            tuple(sorted(counts.items(), key=repr)),
+        )
+
+    def canonicalize(self):
+        """
+        Puts sets of flags in canonical order, so that search results only depend on the key of the input.
+        """
+        self.flags.sort(key=lambda item: repr((item[0], self._get_point(item[1]))))
+
     @classmethod
     def from_diffed_grouped_shader(
         cls,
@@ -38,8 +66,13 @@ class ExpressionSearchInput:
         all_flags: AllFlags,
     ):
         calc_list: list[ExpressionSearchInput] = []
+        input_indices: dict[tuple, int] = {}
         cls._extract_search_inputs(
-            shader.main_code, all_flags.main_flags, flag_def.main_shader, calc_list
+            shader.main_code,
+            all_flags.main_flags,
+            flag_def.main_shader,
+            calc_list,
+            input_indices,
         )
 
         for func_name, func_body in shader.functions.items():
@@ -48,6 +81,7 @@ class ExpressionSearchInput:
                 all_flags.function_flags[func_name],
                 flag_def.functions[func_name],
                 calc_list,
+                input_indices,
             )
 
         return calc_list
@@ -59,20 +93,30 @@ class ExpressionSearchInput:
         all_flags: list[ShaderFlags],
         flag_def: FlagDefinition,
         expr_search_input_list: list["ExpressionSearchInput"],
+        input_indices: dict[tuple, int],
     ):
+        """
+        Adds search inputs for line groups, inputs with the same key (see `get_key`) are only added once.
+        """
+        # Sets of flags are compared as hashable items, instead of searching condition lists.
+        all_flag_items = [frozenset(flags.items()) for flags in all_flags]
         for line_group in code_line_groups:
             if len(line_group.condition) == len(all_flags):
                 continue
+            condition = {frozenset(flags.items()) for flags in line_group.condition}
             search_input = cls()
             search_input.flag_definition = flag_def
             search_input.flags = [
-                (flags in line_group.condition, flags) for flags in all_flags
+                (flag_items in condition, flags)
+                for flag_items, flags in zip(all_flag_items, all_flags)
             ]
-            try:
-                index = expr_search_input_list.index(search_input)
-            except ValueError:
+            key = search_input.get_key()
+            index = input_indices.get(key)
+            if index is None:
+                search_input.canonicalize()
                 index = len(expr_search_input_list)
                 expr_search_input_list.append(search_input)
+                input_indices[key] = index
             line_group.expression_search_index = index
 
 
@@ -91,11 +135,16 @@ class JoinType(Enum):
     - token1 - `And`
     - token2 - `Or`
     - token3 - `And`
+
+    - `Group` - Token starts a new group of tokens. Each group is evaluated like a separate sequence,
+    and the results of all groups are boolean ORed. Groups allow sums of products,
+    such as `(token0 && token1) || (token2 && token3)`, which can't be formed otherwise.
     """
 
     Or = auto()
     And = auto()
     Initial = auto()
+    Group = auto()
 
 
 class ExpressionSearchToken:
@@ -151,43 +200,96 @@ class ExpressionSearchOutput:
         self.score = 0
 
 
-def _evaluate_expression(
-    expression_token_list: list[ExpressionSearchToken], flags: ShaderFlags
-) -> bool:
-    """
-    Evaluates expression token sequence for a given set of flags.
-    """
-    # Evaluation is in reverse order, as that allows to perform short-circuiting
-    for token in reversed(expression_token_list):
-        token_value = flags.get(token.flag_name, None) == token.flag_value
-
-        if token.is_negative:
-            token_value = not token_value
-
-        if token.join_type is JoinType.And:
-            if not token_value:
-                return False
-        elif token.join_type is JoinType.Or:
-            if token_value:
-                return True
-        elif token.join_type is JoinType.Initial:
-            return token_value
-
-
-def _calc_score(
-    expression_token_list: list[ExpressionSearchToken],
-    flag_outcomes: list[tuple[FlagsOutcome, ShaderFlags]],
-):
+class ExpressionScorer:
     """
-    Calculates the score of a sequence, which is equal to the number of sets of flags that it can correctly match
+    Calculates scores of expression token sequences for search input.
+
+    Each set of flags of the input is a bit in a mask, and every (flag name, flag value) pair is precomputed
+    into a mask of flag sets that have it. That way a token is evaluated for all sets of flags at once, with a single bitwise operation.
     """
-    score = 0
-    for outcome, flags in flag_outcomes:
-        score += (
-            1 if _evaluate_expression(expression_token_list, flags) == outcome else 0
-        )
 
-    return score
+    flag_count: int
+    "Number of sets of flags, which is also the highest possible score"
+    full_mask: int
+    outcome_mask: int
+    "Mask of sets of flags, for which expression should be true"
+    token_masks: dict[tuple[FlagName, FlagValue], int]
+
+    def __init__(self, input: ExpressionSearchInput):
+        self.flag_count = len(input.flags)
+        self.full_mask = (1 << self.flag_count) - 1
+        self.outcome_mask = 0
+        self.token_masks = {}
+
+        for i, (outcome, flags) in enumerate(input.flags):
+            bit = 1 << i
+            if outcome:
+                self.outcome_mask |= bit
+            for flag in flags.items():
+                self.token_masks[flag] = self.token_masks.get(flag, 0) | bit
+
+    def get_token_mask(self, token: ExpressionSearchToken) -> int:
+        """
+        Returns mask of sets of flags, for which the token is true (ignoring its join type).
+        """
+        mask = self.token_masks.get((token.flag_name, token.flag_value), 0)
+        return mask ^ self.full_mask if token.is_negative else mask
+
+    def evaluate(self, expression_token_list: list[ExpressionSearchToken]) -> int:
+        """
+        Returns mask of sets of flags, for which the token sequence is true.
+        """
+        previous_groups_mask = 0
+        mask = 0
+        for token in expression_token_list:
+            token_mask = self.get_token_mask(token)
+            if token.join_type is JoinType.And:
+                mask &= token_mask
+            elif token.join_type is JoinType.Or:
+                mask |= token_mask
+            elif token.join_type is JoinType.Group:
+                previous_groups_mask |= mask
+                mask = token_mask
+            else:
+                mask = token_mask
+        return previous_groups_mask | mask
+
+    def evaluate_tail(
+        self, expression_token_list: list[ExpressionSearchToken]
+    ) -> tuple[int, int]:
+        """
+        Returns masks `(and_mask, or_mask)` for tokens that follow the first token of a sequence.
+        A sequence that starts with a token with mask `m`, followed by these tokens, evaluates to `m & and_mask | or_mask`.
+        """
+        and_mask = self.full_mask
+        or_mask = 0
+        for i, token in enumerate(expression_token_list):
+            if token.join_type is JoinType.Group:
+                # Following groups don't depend on the first token.
+                return and_mask, or_mask | self.evaluate(expression_token_list[i:])
+
+            token_mask = self.get_token_mask(token)
+            if token.join_type is JoinType.And:
+                and_mask &= token_mask
+                or_mask &= token_mask
+            else:
+                or_mask |= token_mask
+        return and_mask, or_mask
+
+    def get_mask_score(self, mask: int) -> int:
+        """
+        Returns the number of sets of flags, which the result of evaluating expression matches.
+        """
+        return self.flag_count - (mask ^ self.outcome_mask).bit_count()
+
+    def calc_score(self, expression_token_list: list[ExpressionSearchToken]) -> int:
+        """
+        Calculates the score of a sequence, which is equal to the number of sets of flags that it can correctly match
+        """
+        # Empty sequence doesn't evaluate to anything, so it doesn't match any set of flags.
+        if not expression_token_list:
+            return 0
+        return self.get_mask_score(self.evaluate(expression_token_list))
 
 
 def _fast_search(input: ExpressionSearchInput):
@@ -198,12 +300,16 @@ def _fast_search(input: ExpressionSearchInput):
 
     This function is fast because it has linear complexity in the token sequence length, but it's not guaranteed to find an exact solution.
     """
+    scorer = ExpressionScorer(input)
     best_expression: list[ExpressionSearchToken] = []
     best_expression_score = 0
 
     current_expression: list[ExpressionSearchToken] = []
 
     for _ in range(len(input.flag_definition) + 5):
+        # Only the last token changes, so the rest of the sequence is evaluated once.
+        previous_mask = scorer.evaluate(current_expression)
+
         best_token = ExpressionSearchToken()
         best_token_score = 0
         current_expression.append(copy(best_token))
@@ -223,7 +329,12 @@ def _fast_search(input: ExpressionSearchInput):
                     for flag_value in flag_values:
                         token.flag_value = flag_value
 
-                        score = _calc_score(current_expression, input.flags)
+                        mask = scorer.get_token_mask(token)
+                        if join_type is JoinType.And:
+                            mask &= previous_mask
+                        elif join_type is JoinType.Or:
+                            mask |= previous_mask
+                        score = scorer.get_mask_score(mask)
 
                         if score > best_token_score:
                             best_token_score = score
@@ -242,13 +353,14 @@ def _fast_search(input: ExpressionSearchInput):
 
 
 def _increment_expression(
-    expression: list[ExpressionSearchToken], flag_def: FlagDefinition
+    expression: list[ExpressionSearchToken], flag_def: FlagDefinition, start: int = 0
 ):
     """
     This function cycles through all possible sequences of tokens.
     Given a sequence of tokens, it creates the next sequence by changing some of the properties of tokens or appending a new token at the end.
+    Tokens before `start` index are kept as they are.
     """
-    for token in expression:
+    for token in expression[start:]:
         # Increment flag value
         flag_value_list = flag_def[token.flag_name]
         new_value_index = flag_value_list.index(token.flag_value) + 1
@@ -292,39 +404,356 @@ def _increment_expression(
     expression.append(token)
 
 
-def _slow_search(input: ExpressionSearchInput, timeout: float = 10):
+class SlowSearch:
     """
     This algorithm attempts to find a sequence of expression tokens that correctly executes for all sets of flags.
 
     It's a brute-force algorithm that checks every possible combination of tokens. Given infinite time it is guaranteed to find the exact solution,
-    but because it has an exponential complexity in the number of tokens in a sequence, it can be quite slow, which is why a timeout parameter is necessary.
+    but because it has an exponential complexity in the number of tokens in a sequence, it can be quite slow, which is why it runs for a limited time.
+
+    Sequences that only differ in the first token are scored together, since the rest of the sequence has to be evaluated only once for all of them.
+    Search can be resumed after it runs out of time, so that it can run in several time slices, which can also be in different processes.
     """
-    best_expression: list[ExpressionSearchToken] = []
-    best_expression_score = 0
 
-    current_expression: list[ExpressionSearchToken] = []
-    t = time.perf_counter()
-    while True:
-        score = _calc_score(current_expression, input.flags)
+    flag_count: int
+    "Number of sets of flags, which is also the highest possible score"
+    best_expression: list[ExpressionSearchToken]
+    best_expression_score: int
+
+    _flag_definition: FlagDefinition
+    _scorer: ExpressionScorer
+    _first_tokens: list[ExpressionSearchToken]
+    _first_token_masks: list[int]
+    _current_expression: list[ExpressionSearchToken]
+
+    def __init__(self, input: ExpressionSearchInput):
+        self.flag_count = len(input.flags)
+        self.best_expression = []
+        self.best_expression_score = 0
+        self._flag_definition = input.flag_definition
+        self._scorer = ExpressionScorer(input)
+
+        # All possible first tokens, in the same order as `_increment_expression` cycles through them.
+        self._first_tokens = []
+        for is_negative in (False, True):
+            for flag_name, flag_values in input.flag_definition.items():
+                for flag_value in flag_values:
+                    token = ExpressionSearchToken()
+                    token.is_negative = is_negative
+                    token.flag_name = flag_name
+                    token.flag_value = flag_value
+                    self._first_tokens.append(token)
+        self._first_token_masks = [
+            self._scorer.get_token_mask(token) for token in self._first_tokens
+        ]
+
+        # Empty sequence is skipped, since it doesn't match any set of flags.
+        # First token of the current sequence is a placeholder, it's replaced by each of the first tokens when scoring.
+        self._current_expression = [copy(self._first_tokens[0])]
+
+    @property
+    def is_exact(self) -> bool:
+        return self.best_expression_score == self.flag_count
+
+    def run(self, timeout: float):
+        """
+        Continues the search until it finds the exact solution or runs for `timeout` seconds.
+        """
+        scorer = self._scorer
+        t = time.perf_counter()
+        while not self.is_exact:
+            and_mask, or_mask = scorer.evaluate_tail(self._current_expression[1:])
+            scores = [
+                scorer.get_mask_score(mask & and_mask | or_mask)
+                for mask in self._first_token_masks
+            ]
+            score = max(scores)
 
-        if score > best_expression_score:
-            best_expression_score = score
-            best_expression = [copy(token) for token in current_expression]
+            if score > self.best_expression_score:
+                self.best_expression_score = score
+                self.best_expression = [copy(self._first_tokens[scores.index(score)])]
+                self.best_expression += [
+                    copy(token) for token in self._current_expression[1:]
+                ]
 
-        if (
-            best_expression_score == len(input.flags)
-            or time.perf_counter() - t >= timeout
-        ):
+            _increment_expression(self._current_expression, self._flag_definition, 1)
+
+            if time.perf_counter() - t >= timeout:
+                break
+
+        return self
+
+
+def _slow_search(input: ExpressionSearchInput, timeout: float = 10):
+    """
+    Runs `SlowSearch` for up to `timeout` seconds.
+    """
+    search = SlowSearch(input).run(timeout)
+    return search.best_expression_score, search.best_expression
+
+
+# Length of the first round of slow search time slices, in seconds.
+_FIRST_ROUND_TIME = 0.1
+# Limits of slow search weights, so that no search takes over or stops entirely.
+_MIN_SEARCH_WEIGHT = 1 / 16
+_MAX_SEARCH_WEIGHT = 16
+
+
+def _run_slow_search(search: SlowSearch, timeout: float):
+    return search.run(timeout)
+
+
+def _schedule_slow_searches(
+    searches: list[SlowSearch], timeout: float, max_workers: int = 1
+) -> list[SlowSearch]:
+    """
+    Runs slow searches in rounds of time slices, until all of them are exact or a shared `timeout` runs out.
+    Every round is twice as long as the previous one, and its time is split between searches in proportion to their weights.
+    Weight of a search doubles when it improves during its slice and halves when it doesn't, so that searches that
+    are still improving get more time. With `max_workers` above 1, slices of a round run in parallel processes.
+    """
+    deadline = time.perf_counter() + timeout
+    weights = [1.0] * len(searches)
+    round_time = _FIRST_ROUND_TIME
+
+    # Number of slices that can run at the same time.
+    worker_count = min(max_workers or os.cpu_count() or 1, len(searches))
+
+    with contextlib.ExitStack() as stack:
+        executor = None
+        if worker_count > 1:
+            executor = stack.enter_context(ProcessPoolExecutor(worker_count))
+
+        while True:
+            active = [i for i, search in enumerate(searches) if not search.is_exact]
+            remaining_time = deadline - time.perf_counter()
+            if not active or remaining_time <= 0:
+                break
+
+            round_time = min(round_time, remaining_time)
+            total_time = round_time * min(worker_count, len(active))
+            total_weight = sum(weights[i] for i in active)
+            slices = [
+                min(round_time, total_time * weights[i] / total_weight) for i in active
+            ]
+            scores = [searches[i].best_expression_score for i in active]
+
+            active_searches = [searches[i] for i in active]
+            if executor is None:
+                results = map(_run_slow_search, active_searches, slices)
+            else:
+                results = executor.map(_run_slow_search, active_searches, slices)
+
+            for i, search, score in zip(active, results, scores):
+                searches[i] = search
+                weight = weights[i] * (
+                    2 if search.best_expression_score > score else 0.5
+                )
+                weights[i] = min(max(weight, _MIN_SEARCH_WEIGHT), _MAX_SEARCH_WEIGHT)
+
+            round_time *= 2
+
+    return searches
+
+
+def _get_box_mask(value_masks: list[list[int]], box: list[int]) -> int:
+    """
+    Returns a mask of points that are inside of a box. Box has a bit mask of allowed value indices for each flag,
+    and `value_masks` has a mask of points with each value of each flag.
+    """
+    mask = -1
+    for flag_value_masks, allowed_values in zip(value_masks, box):
+        flag_mask = 0
+        for value_index, value_mask in enumerate(flag_value_masks):
+            if allowed_values >> value_index & 1:
+                flag_mask |= value_mask
+        mask &= flag_mask
+        if not mask:
             break
+    return mask
 
-        _increment_expression(current_expression, input.flag_definition)
 
-    return best_expression_score, best_expression
+def _expand_box(
+    box: list[int],
+    off_value_masks: list[list[int]],
+    flag_order: list[int],
+) -> list[int]:
+    """
+    Allows as many values in a box as possible, while it doesn't include any points that should be false.
+    Flags are expanded in the specified order, first by dropping the flag altogether, then one value at a time.
+    """
+    box = box[:]
+    for flag_index in flag_order:
+        value_count = len(off_value_masks[flag_index])
+        expanded_box = box[:]
+        expanded_box[flag_index] = (1 << value_count) - 1
+        if not _get_box_mask(off_value_masks, expanded_box):
+            box = expanded_box
+            continue
+
+        for value_index in range(value_count):
+            expanded_box = box[:]
+            expanded_box[flag_index] |= 1 << value_index
+            if not _get_box_mask(off_value_masks, expanded_box):
+                box = expanded_box
+    return box
+
+
+def _box_to_products(
+    box: list[int],
+    flag_names: list[FlagName],
+    domains: list[list[FlagValue | None]],
+) -> list[list[ExpressionSearchToken]]:
+    """
+    Converts a box into products of tokens (with unset join types). A single box can take more than one product,
+    when a flag has to match one of several values, but the flag can also be missing.
+    """
+    products: list[list[ExpressionSearchToken]] = [[]]
+    for flag_name, domain, allowed_values in zip(flag_names, domains, box):
+        if allowed_values == (1 << len(domain)) - 1:
+            continue
+
+        allowed = [value for i, value in enumerate(domain) if allowed_values >> i & 1]
+        disallowed = [
+            value for i, value in enumerate(domain) if not allowed_values >> i & 1
+        ]
+
+        # Each option is a list of tokens that are ANDed.
+        options: list[list[tuple[bool, FlagValue]]]
+        if len(allowed) == 1 and allowed[0] is not None:
+            options = [[(False, allowed[0])]]
+        elif None not in disallowed:
+            options = [[(True, value) for value in disallowed if value is not None]]
+        else:
+            options = [[(False, value)] for value in allowed]
+
+        new_products: list[list[ExpressionSearchToken]] = []
+        for product in products:
+            for option in options:
+                new_product = product[:]
+                for is_negative, flag_value in option:
+                    token = ExpressionSearchToken()
+                    token.is_negative = is_negative
+                    token.flag_name = flag_name
+                    token.flag_value = flag_value
+                    new_product.append(token)
+                new_products.append(new_product)
+        products = new_products
+
+    return products
+
+
+def _exact_search(input: ExpressionSearchInput):
+    """
+    This algorithm synthesizes an expression from the truth table of the input, instead of searching for it.
+
+    Each set of flags is a point in a space, where every flag of the flag definition is a dimension that takes exactly one of its values.
+    Expression is a sum of products, where each product is a box in that space, with a set of allowed values for each flag.
+    Boxes are grown from points that should be true, for as long as they don't include any points that should be false (Espresso-style expansion),
+    and then a small set of boxes that covers all points that should be true is chosen.
+    Combinations of flag values that don't occur in the input can be either true or false, which is what keeps the expression small.
+
+    It has polynomial complexity in the number of flags and their values and the result always matches all sets of flags,
+    as long as sets of flags with different outcomes don't only differ in flags that are not in the flag definition.
+    Otherwise there is no exact solution, and `None` is returned.
+    """
+    flag_names = list(input.flag_definition)
+
+    # Flag sets can have values that are not in the flag definition, or not have the flag at all (`None`).
+    domains: list[list[FlagValue | None]] = [
+        list(flag_values) for flag_values in input.flag_definition.values()
+    ]
+    outcomes: dict[tuple[int, ...], FlagsOutcome] = {}
+    for outcome, flags in input.flags:
+        point = []
+        for flag_name, domain in zip(flag_names, domains):
+            flag_value = flags.get(flag_name, None)
+            if flag_value not in domain:
+                domain.append(flag_value)
+            point.append(domain.index(flag_value))
+
+        if outcomes.setdefault(tuple(point), outcome) != outcome:
+            return None
+
+    on_points = [point for point, outcome in outcomes.items() if outcome]
+    off_points = [point for point, outcome in outcomes.items() if not outcome]
+    if not on_points or not off_points:
+        return None
+
+    def get_value_masks(points: list[tuple[int, ...]]):
+        value_masks = [[0] * len(domain) for domain in domains]
+        for i, point in enumerate(points):
+            for flag_index, value_index in enumerate(point):
+                value_masks[flag_index][value_index] |= 1 << i
+        return value_masks
+
+    on_value_masks = get_value_masks(on_points)
+    off_value_masks = get_value_masks(off_points)
+
+    # Prime boxes, with masks of points that should be true, which they cover.
+    # Points that are already covered are not expanded again.
+    flag_count = len(flag_names)
+    flag_orders = [
+        list(range(i, flag_count)) + list(range(i)) for i in range(flag_count)
+    ]
+    boxes: dict[tuple[int, ...], int] = {}
+    covered_mask = 0
+    for i, point in enumerate(on_points):
+        if covered_mask >> i & 1:
+            continue
+        for flag_order in flag_orders:
+            box = _expand_box([1 << j for j in point], off_value_masks, flag_order)
+            box = tuple(box)
+            if box not in boxes:
+                boxes[box] = _get_box_mask(on_value_masks, box)
+                covered_mask |= boxes[box]
+
+    box_products = {box: _box_to_products(box, flag_names, domains) for box in boxes}
+    box_costs = {
+        box: sum(len(product) for product in products)
+        for box, products in box_products.items()
+    }
+
+    # Greedy cover: box that covers the most of remaining points, then the cheapest one.
+    cover: list[tuple[int, ...]] = []
+    remaining_mask = (1 << len(on_points)) - 1
+    while remaining_mask:
+        box = max(
+            boxes,
+            key=lambda box: (
+                (boxes[box] & remaining_mask).bit_count(),
+                -box_costs[box],
+            ),
+        )
+        cover.append(box)
+        remaining_mask &= ~boxes[box]
+
+    # Remove boxes, which only cover points that other boxes cover as well, most expensive first.
+    for box in sorted(cover, key=lambda box: -box_costs[box]):
+        others_mask = 0
+        for other_box in cover:
+            if other_box != box:
+                others_mask |= boxes[other_box]
+        if boxes[box] & ~others_mask == 0:
+            cover.remove(box)
+
+    expression: list[ExpressionSearchToken] = []
+    for box in cover:
+        for product in box_products[box]:
+            for i, token in enumerate(product):
+                if i != 0:
+                    token.join_type = JoinType.And
+                elif expression:
+                    token.join_type = JoinType.Group
+            expression += product
+
+    return ExpressionScorer(input).calc_score(expression), expression
 
 
 # This is a work-in-progress new search algorithm,
 # although I might remove it because it kinda sucks in comparison to a combination of fast + slow search
 def _hybrid_search(input: ExpressionSearchInput, timeout: float = 10):
+    scorer = ExpressionScorer(input)
     best_expression: list[ExpressionSearchToken] = []
     best_expression_score = 0
 
@@ -348,7 +777,7 @@ def _hybrid_search(input: ExpressionSearchInput, timeout: float = 10):
             best_extension_score = 0
 
             while True:
-                score = _calc_score(expression + expression_extension, input.flags)
+                score = scorer.calc_score(expression + expression_extension)
 
                 if score == len(input.flags):
                     return score, expression + expression_extension
@@ -379,29 +808,50 @@ def _hybrid_search(input: ExpressionSearchInput, timeout: float = 10):
     return best_expression_score, best_expression
 
 
-def expression_search(inputs: list[ExpressionSearchInput], timeout: float = 10):
+def expression_search(
+    inputs: list[ExpressionSearchInput], timeout: float = 10, max_workers: int = 1
+):
     """
     This function applies search algorithms in order to find a boolean expression that would correctly match all sets of flags.
+    Inputs that can't be solved exactly without it share a single `timeout` of slow search, which can run in up to `max_workers` processes
+    (0 means one per CPU core).
     """
-    output_list: list[ExpressionSearchOutput] = []
-    for input in inputs:
+    results: list[tuple[int, list[ExpressionSearchToken]]] = []
+    slow_searches: dict[int, SlowSearch] = {}
+    for index, input in enumerate(inputs):
         score, result = _fast_search(input)
         # score, result = _hybrid_search(input, timeout)
 
+        if score != len(input.flags):
+            exact_result = _exact_search(input)
+            if exact_result is not None:
+                score, result = exact_result
+
         if score != len(input.flags):
             print("Slow Search")
+            slow_searches[index] = SlowSearch(input)
+
+        results.append((score, result))
 
-            slow_score, slow_result = _slow_search(input, timeout)
+    finished_searches = _schedule_slow_searches(
+        list(slow_searches.values()), timeout, max_workers
+    )
+    for index, search in zip(slow_searches, finished_searches):
+        score, result = results[index]
+        slow_score = search.best_expression_score
+        slow_result = search.best_expression
 
-            if slow_score > score or (
-                slow_score == score and len(slow_result) < len(result)
-            ):
-                score = slow_score
-                result = slow_result
+        if slow_score > score or (
+            slow_score == score and len(slow_result) < len(result)
+        ):
+            score = slow_score
+            results[index] = slow_score, slow_result
 
-            if score < len(input.flags):
-                print("Not Found")
+        if score < search.flag_count:
+            print("Not Found")
 
+    output_list: list[ExpressionSearchOutput] = []
+    for score, result in results:
         search_output = ExpressionSearchOutput()
         search_output.score = score
         search_output.token_list = result
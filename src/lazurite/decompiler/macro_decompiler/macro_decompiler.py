@@ -7,10 +7,11 @@ from .type_aliases import ShaderCode, ShaderFlags
 from .permutation import ShaderPermutation
 from .encoded_shader import EncodedShader
 from .expression_processing import (
-    convert_to_sympy_expression,
-    process_sympy_expressions,
+    process_expressions,
     mark_approximated_results,
+    get_condition_macros,
 )
+from .condition_cache import ConditionCache
 from .variables import (
     process_stuff,
     inline_buffers,
@@ -30,14 +31,70 @@ class InputVariant:
     code: ShaderCode
 
 
+def _find_macro_conditions(
+    search_inputs: list[ExpressionSearchInput],
+    search_timeout: float,
+    search_workers: int,
+    condition_cache: ConditionCache | None,
+) -> tuple[list[str], set[str]]:
+    """
+    Returns macro conditions for search inputs, along with a set of macros that they use.
+    With `condition_cache`, cached conditions are reused and new exact conditions are added to it.
+    """
+    if not search_inputs:
+        return [], set()
+
+    keys = [search_input.get_key() for search_input in search_inputs]
+    conditions = condition_cache.get(keys) if condition_cache is not None else {}
+
+    missing_inputs = [
+        search_input
+        for search_input, key in zip(search_inputs, keys)
+        if key not in conditions
+    ]
+    missing_keys = [key for key in keys if key not in conditions]
+
+    search_results = expression_search(missing_inputs, search_timeout, search_workers)
+    macro_conditionals, _ = process_expressions(
+        [res.token_list for res in search_results]
+    )
+
+    if condition_cache is not None:
+        condition_cache.put(
+            {
+                key: macro_conditional
+                for key, macro_conditional, search_input, result in zip(
+                    missing_keys, macro_conditionals, missing_inputs, search_results
+                )
+                if result.score == len(search_input.flags)
+            }
+        )
+
+    macro_conditionals = mark_approximated_results(
+        macro_conditionals, search_results, missing_inputs
+    )
+    conditions.update(zip(missing_keys, macro_conditionals))
+
+    macro_conditionals = [conditions[key] for key in keys]
+    used_macros: set[str] = set()
+    for macro_conditional in macro_conditionals:
+        used_macros.update(get_condition_macros(macro_conditional))
+
+    return macro_conditionals, used_macros
+
+
 def restore_code(
     input_variants: list[InputVariant],
     remove_comments=True,
     process_shaders=False,
     search_timeout: float = 10,
+    condition_cache: ConditionCache | None = None,
+    search_workers: int = 1,
 ) -> tuple[set[str], str]:
     """
     Attempts to restore original shader source, by combining variants while adding missing macros.
+    With `condition_cache`, macro conditions that were found before are not searched for again.
+    Macro conditions that need slow search share `search_timeout` seconds, and it runs in up to `search_workers` processes.
     """
     shader_permutations: list[ShaderPermutation] = []
     for variant in input_variants:
@@ -77,14 +134,8 @@ def restore_code(
     expr_search_inputs = ExpressionSearchInput.from_diffed_grouped_shader(
         diffed_grouped_shader, local_flag_definition, all_flags
     )
-    search_results = expression_search(expr_search_inputs, search_timeout)
-    sympy_expressions = [
-        convert_to_sympy_expression(res.token_list) for res in search_results
-    ]
-    macro_conditionals, used_macros = process_sympy_expressions(sympy_expressions)
-
-    macro_conditionals = mark_approximated_results(
-        macro_conditionals, search_results, expr_search_inputs
+    macro_conditionals, used_macros = _find_macro_conditions(
+        expr_search_inputs, search_timeout, search_workers, condition_cache
     )
 
     code = diffed_grouped_shader.assemble_code(
@@ -1,6 +1,6 @@
 import re
 
-from .macro_decompiler import restore_code, InputVariant
+from .macro_decompiler import restore_code, InputVariant, ConditionCache
 from lazurite import util
 from lazurite.material.stage import ShaderStage
 from lazurite.material.platform import ShaderPlatform
@@ -88,7 +88,18 @@ def _postprocess_varying(code: str):
     return code
 
 
-def restore_varying(permutations: list[InputVariant], search_timeout: float = 10):
-    _, code = restore_code(permutations, False, search_timeout=search_timeout)
+def restore_varying(
+    permutations: list[InputVariant],
+    search_timeout: float = 10,
+    condition_cache: ConditionCache | None = None,
+    search_workers: int = 1,
+):
+    _, code = restore_code(
+        permutations,
+        False,
+        search_timeout=search_timeout,
+        condition_cache=condition_cache,
+        search_workers=search_workers,
+    )
 
     return _postprocess_varying(code)
@@ -1,4 +1,4 @@
-import json, os
+import json, os, struct
 from io import BytesIO
 from enum import Enum
 
@@ -17,6 +17,8 @@ class TextureWrap(Enum):
 
 
 class SamplerState:
+    __slots__ = ("filter", "wrapping")
+
     filter: TextureFilter
     wrapping: TextureWrap
 
@@ -75,7 +77,30 @@ class BufferType(Enum):
 
 
 class Buffer:
+    __slots__ = (
+        "name",
+        "register_slot",
+        "access",
+        "precision",
+        "unordered_access",
+        "type",
+        "texture_format",
+        "slot_count",
+        "binding_slot",
+        "sampler_state",
+        "default_texture",
+        "texture_path",
+        "custom_type_info",
+    )
+
+    # Register slot, access, precision, unordered access and type.
+    HEADER_CODEC = struct.Struct("<HBB?B")
+    # Slot count and binding slot.
+    SLOT_CODEC = struct.Struct("<LB")
+
     class CustomTypeInfo:
+        __slots__ = ("struct", "size")
+
         struct: str
         size: int
 
@@ -114,15 +139,17 @@ class Buffer:
 
     def read(self, file: BytesIO, version: int):
         self.name = util.read_string(file)
-        self.register_slot = util.read_ushort(file)
-        self.access = BufferAccess(util.read_ubyte(file))  # 1 2 3
-        self.precision = Precision(util.read_ubyte(file))  # 0 2
-        self.unordered_access = util.read_bool(file)
-        self.type = BufferType(util.read_ubyte(file))  # 0 - 9
+        register_slot, access, precision, unordered_access, buffer_type = (
+            util.read_struct(file, self.HEADER_CODEC)
+        )
+        self.register_slot = register_slot
+        self.access = BufferAccess(access)  # 1 2 3
+        self.precision = Precision(precision)  # 0 2
+        self.unordered_access = unordered_access
+        self.type = BufferType(buffer_type)  # 0 - 9
         # Values according to bgfx_compute.sh: (empty string) r32ui rg32ui rgba32ui r32f r16f rg16f rgba16f rgba8 rg8 r8 rgba32f float int uint
         self.texture_format = util.read_string(file)
-        self.slot_count = util.read_ulong(file)
-        self.binding_slot = util.read_ubyte(file)
+        self.slot_count, self.binding_slot = util.read_struct(file, self.SLOT_CODEC)
 
         if util.read_bool(file):
             self.sampler_state = SamplerState(util.read_ubyte(file))
@@ -144,14 +171,17 @@ class Buffer:
 
     def write(self, file: BytesIO, version: int):
         util.write_string(file, self.name)
-        util.write_ushort(file, self.register_slot)
-        util.write_ubyte(file, self.access.value)
-        util.write_ubyte(file, self.precision.value)
-        util.write_bool(file, self.unordered_access)
-        util.write_ubyte(file, self.type.value)
+        util.write_struct(
+            file,
+            self.HEADER_CODEC,
+            self.register_slot,
+            self.access.value,
+            self.precision.value,
+            self.unordered_access,
+            self.type.value,
+        )
         util.write_string(file, self.texture_format)
-        util.write_ulong(file, self.slot_count)
-        util.write_ubyte(file, self.binding_slot)
+        util.write_struct(file, self.SLOT_CODEC, self.slot_count, self.binding_slot)
 
         util.write_bool(file, self.sampler_state is not None)
         if self.sampler_state is not None:
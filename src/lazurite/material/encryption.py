@@ -1,5 +1,8 @@
 from enum import Enum
 from io import BytesIO
+import os
+
+from Crypto.Cipher import AES
 
 
 class EncryptionType(Enum):
@@ -9,7 +12,145 @@ class EncryptionType(Enum):
 
     @classmethod
     def read(cls, file: BytesIO):
-        return cls(file.read(4).decode()[::-1])
+        return cls(str(file.read(4), "utf-8")[::-1])
 
     def write(self, file: BytesIO):
         file.write(self.value[::-1].encode())
+
+
+# Encrypted payload is AES-GCM ciphertext without authentication tag, which is the same as AES-CTR
+# with the counter block starting at 2 (counter block 1 is only used for the tag). Using CTR directly allows
+# to start decryption at any block, so parts of the payload can be skipped without decrypting them.
+_GCM_INITIAL_COUNTER = 2
+_BLOCK_SIZE = 16
+
+
+def _new_cipher(key: bytes, nonce: bytes, block: int = 0):
+    """
+    Returns AES cipher positioned at the specified block of the payload.
+    """
+    return AES.new(
+        bytes(key),
+        AES.MODE_CTR,
+        nonce=bytes(nonce),
+        initial_value=_GCM_INITIAL_COUNTER + block,
+    )
+
+
+class DecryptingReader:
+    """
+    File-like reader over an encrypted material payload, which decrypts it in chunks as it's read.
+    Seeking forward skips the data without decrypting it.
+    """
+
+    CHUNK_SIZE = 0x10000
+
+    file: BytesIO
+    size: int
+    offset: int
+
+    _key: bytes
+    _nonce: bytes
+    _start: int  # Position of the payload in the source file.
+    _cipher: object
+    _cipher_offset: int
+    _chunk: memoryview
+    _chunk_offset: int
+
+    def __init__(self, file: BytesIO, size: int, key: bytes, nonce: bytes):
+        self.file = file
+        self.size = size
+        self.offset = 0
+        self._key = key
+        self._nonce = nonce
+        self._start = file.tell()
+        self._cipher = None
+        self._cipher_offset = -1
+        self._chunk = memoryview(b"")
+        self._chunk_offset = 0
+
+    def _decrypt(self, offset: int, size: int) -> bytes:
+        if self._cipher_offset == offset:
+            data = self._cipher.decrypt(self.file.read(size))
+        else:
+            # Cipher can only be started at a block boundary, preceding bytes of the block are dropped.
+            block, block_offset = divmod(offset, _BLOCK_SIZE)
+            self._cipher = _new_cipher(self._key, self._nonce, block)
+            self.file.seek(self._start + offset - block_offset)
+            data = self._cipher.decrypt(self.file.read(block_offset + size))
+            data = data[block_offset:]
+        self._cipher_offset = offset + size
+        return data
+
+    def read(self, size: int = -1) -> bytes | memoryview:
+        # Most reads are small and served from the current chunk.
+        chunk_start = self.offset - self._chunk_offset
+        if size >= 0 and 0 <= chunk_start and chunk_start + size <= len(self._chunk):
+            self.offset += size
+            return self._chunk[chunk_start : chunk_start + size]
+
+        start = self.offset
+        end = self.size if size < 0 else min(start + size, self.size)
+        if end <= start:
+            return b""
+        self.offset = end
+
+        if end - start >= self.CHUNK_SIZE:
+            # Large reads are decrypted directly, without going through the chunk.
+            return self._decrypt(start, end - start)
+
+        self._chunk = memoryview(
+            self._decrypt(start, min(self.CHUNK_SIZE, self.size - start))
+        )
+        self._chunk_offset = start
+        return self._chunk[: end - start]
+
+    def tell(self) -> int:
+        return self.offset
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self.offset
+        elif whence == os.SEEK_END:
+            offset += self.size
+        self.offset = offset
+        return self.offset
+
+
+class EncryptingWriter:
+    """
+    File-like writer, which encrypts material payload in chunks as it's written.
+    """
+
+    CHUNK_SIZE = 0x10000
+
+    file: BytesIO
+    size: int  # Number of bytes written so far.
+
+    _cipher: object
+    _buffer: bytearray
+
+    def __init__(self, file: BytesIO, key: bytes, nonce: bytes):
+        self.file = file
+        self.size = 0
+        self._cipher = _new_cipher(key, nonce)
+        self._buffer = bytearray()
+
+    def write(self, data: bytes | memoryview):
+        self.size += len(data)
+        if len(data) >= self.CHUNK_SIZE:
+            self.flush()
+            self.file.write(self._cipher.encrypt(data))
+            return
+
+        self._buffer += data
+        if len(self._buffer) >= self.CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        """
+        Encrypts and writes all buffered data.
+        """
+        if self._buffer:
+            self.file.write(self._cipher.encrypt(self._buffer))
+            self._buffer.clear()
@@ -1,10 +1,17 @@
-import pyjson5
+import copy
 import json
+import mmap
 import os
-from Crypto.Cipher import AES
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from io import BytesIO
 
-from lazurite.decompiler.macro_decompiler import InputVariant, restore_code
+from lazurite.decompiler.macro_decompiler import (
+    InputVariant,
+    restore_code,
+    ConditionCache,
+)
 from lazurite.decompiler.varying_decompiler import (
     restore_varying,
     generate_varying_line,
@@ -17,13 +24,24 @@ from .shader_pass import Pass
 from .platform import ShaderPlatform
 from .stage import ShaderStage
 from .shader_pass.shader_input import ShaderInput
-from .encryption import EncryptionType
+from .shader_pass.bgfx_shader import BgfxShader, BgfxShaderPool
+from .encryption import EncryptionType, DecryptingReader, EncryptingWriter
+from .meta import MetaCompression, encode_meta, decode_meta
+from .material_scan import MaterialScan, PassScan
+
+
+def _read_pass(data: bytes, version: int, lazy: bool) -> Pass:
+    return Pass().read(util.MemoryReader(data), version, lazy)
 
 
 class Material:
     MAGIC = 168942106
     EXTENSION = ".material.bin"
     JSON_EXTENSION = ".material.json"
+    META_EXTENSION = ".material.meta"
+    MERGE_SOURCE_EXTENSIONS = (EXTENSION, JSON_EXTENSION, META_EXTENSION)
+    INDEX_EXTENSION = ".material.index"
+    INDEX_FORMAT_VERSION = 1
     JSON_FORMAT_VERSION = 2
     COMPILED_MATERIAL_DEFINITION = "RenderDragon.CompiledMaterialDefinition"
     INITIAL_VERSION = 22
@@ -54,15 +72,28 @@ class Material:
         self._encryption_key = b""
         self._encryption_nonce = b""
 
-    def read(self, file: BytesIO):
+    def read(
+        self,
+        file: BytesIO,
+        lazy=False,
+        pool: BgfxShaderPool | None = None,
+        max_workers=1,
+    ):
         """
         Loads material definition from a binary file-like object.
+        In `lazy` mode, compiled BGFX shaders are only parsed when they are accessed.
+        With `pool`, identical compiled shaders are stored only once (also across materials read with the same pool).
+        With `max_workers` other than 1, passes are decoded concurrently in up to that many processes (0 for all cores),
+        which can't be combined with `pool`.
         """
+        self._read_header(file)
+        self._read_remaining(self._decrypt(file), lazy, pool, max_workers)
+
+    def _read_header(self, file: BytesIO):
         self._validate_magic(file)
         self._validate_definition(file)
         self.version = util.read_ulonglong(file)
         self._validate_version()
-        self._decrypt_and_read(file)
 
     def _validate_magic(self, file: BytesIO):
         if self.MAGIC != util.read_ulonglong(file):
@@ -78,26 +109,75 @@ class Material:
                 f"Unsupported material version: {self.version}, only versions between {self.INITIAL_VERSION} and {self.LATEST_VERSION} are supported"
             )
 
-    def _decrypt_and_read(self, file: BytesIO):
+    def _decrypt(self, file: BytesIO, stream=False):
+        """
+        Returns a reader of material payload after encryption properties.
+        With `stream`, encrypted payload is decrypted in chunks only where it's read, which suits reading only a part of it.
+        """
         self.encryption = EncryptionType.read(file)
 
         if self.encryption == EncryptionType.SIMPLE_PASSPHRASE:
-            self._encryption_key = util.read_array(file)
-            self._encryption_nonce = util.read_array(file)
+            # Copied, so that the material doesn't keep the whole read buffer alive.
+            self._encryption_key = bytes(util.read_array(file))
+            self._encryption_nonce = bytes(util.read_array(file))
 
-            cipher = AES.new(
+            file = DecryptingReader(
+                file,
+                util.read_ulong(file),
                 self._encryption_key,
-                AES.MODE_GCM,
                 self._get_truncated_nonce(),
             )
-            file = BytesIO(cipher.decrypt(util.read_array(file)))
+            if not stream:
+                # Decrypting whole payload at once and parsing it from memory is faster, when all of it is needed.
+                file = util.MemoryReader(file.read())
 
         elif self.encryption == EncryptionType.KEY_PAIR:
             raise Exception("Huh, how did we even get here?")
 
-        self._read_remaining(file)
+        return file
 
-    def _read_remaining(self, file: BytesIO):
+    def _read_remaining(
+        self,
+        file: BytesIO,
+        lazy=False,
+        pool: BgfxShaderPool | None = None,
+        max_workers=1,
+    ):
+        self._read_properties(file)
+        if max_workers == 1:
+            self._read_items(file, Pass, self.passes, util.read_ushort, lazy, pool)
+        else:
+            self._read_passes_parallel(file, lazy, pool, max_workers)
+        self._validate_magic(file)
+
+    def _read_passes_parallel(
+        self, file: BytesIO, lazy: bool, pool: BgfxShaderPool | None, max_workers: int
+    ):
+        if pool is not None:
+            raise Exception("Shader pool can't be used when reading passes in parallel")
+
+        # Find where each pass is encoded by skipping over compiled shaders.
+        pass_bounds: list[tuple[int, int]] = []
+        for _ in range(util.read_ushort(file)):
+            start = file.tell()
+            Pass.skip(file, self.version)
+            pass_bounds.append((start, file.tell()))
+        end = file.tell()
+
+        # Decode passes in worker processes, largest first.
+        with ProcessPoolExecutor(max_workers=max_workers or None) as executor:
+            futures = {}
+            for start, stop in sorted(
+                pass_bounds, key=lambda bounds: bounds[1] - bounds[0], reverse=True
+            ):
+                file.seek(start)
+                data = bytes(file.read(stop - start))
+                futures[start] = executor.submit(_read_pass, data, self.version, lazy)
+            self.passes = [futures[start].result() for start, _ in pass_bounds]
+
+        file.seek(end)
+
+    def _read_properties(self, file: BytesIO):
         self.name = util.read_string(file)
         self._read_parent(file)
         self._read_items(file, Buffer, self.buffers, util.read_ubyte)
@@ -106,15 +186,15 @@ class Material:
             # Note: "Core/Builtins" material is missing this field.
             # This is likely a bug and will be fixed in future game updates
             self._read_uniform_overrides(file)
-        self._read_items(file, Pass, self.passes, util.read_ushort)
-        self._validate_magic(file)
 
     def _read_parent(self, file: BytesIO):
         self.parent = util.read_string(file) if util.read_bool(file) else ""
 
-    def _read_items(self, file: BytesIO, item_type, item_list, read_count):
+    def _read_items(self, file: BytesIO, item_type, item_list, read_count, *args):
         count = read_count(file)
-        item_list[:] = [item_type().read(file, self.version) for _ in range(count)]
+        item_list[:] = [
+            item_type().read(file, self.version, *args) for _ in range(count)
+        ]
 
     def _read_uniform_overrides(self, file: BytesIO):
         for _ in range(util.read_ushort(file)):
@@ -127,6 +207,14 @@ class Material:
         """
         Writes material definition into a binary file-like object.
         """
+        payload = self._write_header(file)
+        self._write_remaining(payload)
+        self._finish_payload(file, payload)
+
+    def _write_header(self, file: BytesIO):
+        """
+        Writes material header and encryption properties, returns a writer of material payload.
+        """
         util.write_ulonglong(file, self.MAGIC)
         util.write_string(file, self.COMPILED_MATERIAL_DEFINITION)
         util.write_ulonglong(file, self.version)
@@ -136,24 +224,33 @@ class Material:
             util.write_array(file, self._encryption_key)
             util.write_array(file, self._encryption_nonce)
 
-            data = BytesIO()
-            self._write_remaining(data)
-            data.seek(0)
-            data = data.read()
-            cipher = AES.new(
-                self._encryption_key,
-                AES.MODE_GCM,
-                self._get_truncated_nonce(),
+            # Payload is encrypted in chunks while it's being written, its size is filled in afterwards.
+            util.write_ulong(file, 0)
+            return EncryptingWriter(
+                file, self._encryption_key, self._get_truncated_nonce()
             )
-            util.write_array(file, cipher.encrypt(data))
 
         elif self.encryption == EncryptionType.KEY_PAIR:
             raise Exception("Huh, how did we even get here?")
 
-        else:
-            self._write_remaining(file)
+        return file
+
+    def _finish_payload(self, file: BytesIO, payload: BytesIO):
+        if isinstance(payload, EncryptingWriter):
+            payload.flush()
+
+            # Encrypted payload has the same size as the plain one, its size prefix directly precedes it.
+            end_position = file.tell()
+            file.seek(end_position - payload.size - util.ULONG.size)
+            util.write_ulong(file, payload.size)
+            file.seek(end_position)
 
     def _write_remaining(self, file: BytesIO):
+        self._write_properties(file)
+        self._write_items(file, self.passes, util.write_ushort)
+        util.write_ulonglong(file, self.MAGIC)
+
+    def _write_properties(self, file: BytesIO):
         util.write_string(file, self.name)
 
         util.write_bool(file, bool(self.parent))
@@ -166,10 +263,6 @@ class Material:
         if self.name != "Core/Builtins":
             self._write_uniform_overrides(file)
 
-        self._write_items(file, self.passes, util.write_ushort)
-
-        util.write_ulonglong(file, self.MAGIC)
-
     def _write_items(self, file: BytesIO, item_list: list, write_count):
         write_count(file, len(item_list))
         for item in item_list:
@@ -181,6 +274,52 @@ class Material:
             util.write_string(file, uniform_name)
             util.write_string(file, override_id)
 
+    @classmethod
+    def transcode(
+        cls,
+        file: BytesIO,
+        outputs: list[tuple[BytesIO, int | None]],
+        clear_shaders=False,
+    ):
+        """
+        Copies a binary material into one or more outputs, each with its own format version (`None` keeps the source version).
+        Material is read once and field by field, so memory use doesn't depend on its size.
+        Only version dependent fields are decoded and re-encoded, everything else is copied verbatim.
+        With `clear_shaders`, compiled shader code is removed and outputs are not encrypted.
+        Returns source material with its properties, but without passes.
+        """
+        material = cls()
+        material._read_header(file)
+        payload = material._decrypt(file, stream=True)
+        material._read_properties(payload)
+
+        targets: list[tuple[Material, BytesIO, BytesIO]] = []
+        for output, version in outputs:
+            target = copy.copy(material)
+            if version is not None:
+                target.version = version
+                target._validate_version()
+            if clear_shaders:
+                target.encryption = EncryptionType.NONE
+
+            target_payload = target._write_header(output)
+            target._write_properties(target_payload)
+            targets.append((target, output, target_payload))
+
+        pass_count = util.read_ushort(payload)
+        pass_outputs = [(writer, target.version) for target, _, writer in targets]
+        for writer, _ in pass_outputs:
+            util.write_ushort(writer, pass_count)
+        for _ in range(pass_count):
+            Pass.transcode(payload, material.version, pass_outputs, clear_shaders)
+
+        material._validate_magic(payload)
+        for target, output, writer in targets:
+            util.write_ulonglong(writer, cls.MAGIC)
+            target._finish_payload(output, writer)
+
+        return material
+
     def _get_truncated_nonce(self):
         return self._encryption_nonce[:12]
 
@@ -226,26 +365,41 @@ class Material:
             for item in item_list:
                 item.store(self.version, subfolder_dir, *args)
 
-    def serialize_minimal(self):
+    def serialize_minimal(self, stream=False):
         """
         Returns a single minimal json dictionary with only material properties necessary for merge source.
+        With `stream` passes and variants are produced lazily, as `util.JsonStream`.
         """
         flag_defs = self.get_flag_definitions()
         flag_defs = {x: list(y) for x, y in flag_defs.items()}
         for values in flag_defs.values():
             values.sort()
 
-        input_defs: list[ShaderInput] = []
+        # Unique inputs in order of appearance.
+        input_table: dict[ShaderInput, None] = {}
         for shader_pass in self.passes:
             for variant in shader_pass.variants:
                 for shader in variant.shaders:
-                    for shader_input in shader.inputs:
-                        if shader_input not in input_defs:
-                            input_defs.append(shader_input)
+                    input_table.update(dict.fromkeys(shader.inputs))
 
+        input_defs = list(input_table)
         input_defs.sort(
             key=lambda x: f"{x.name}_{x.semantic.index}_{x.semantic.sub_index}"
         )
+        input_indices = {shader_input: i for i, shader_input in enumerate(input_defs)}
+
+        # Flag key -> (key index, value -> value index).
+        flag_indices = {
+            key: (i, {value: j for j, value in enumerate(values)})
+            for i, (key, values) in enumerate(flag_defs.items())
+        }
+
+        passes = (
+            render_pass.serialize_minimal(
+                flag_indices, input_indices, self.version, stream
+            )
+            for render_pass in self.passes
+        )
 
         json = [
             self.JSON_FORMAT_VERSION,
@@ -257,10 +411,7 @@ class Material:
             [buffer.serialize_minimal() for buffer in self.buffers],
             [uniform.serialize_minimal() for uniform in self.uniforms],
             self.uniform_overrides,
-            [
-                render_pass.serialize_minimal(flag_defs, input_defs, self.version)
-                for render_pass in self.passes
-            ],
+            util.JsonStream(passes) if stream else list(passes),
         ]
         return json
 
@@ -276,7 +427,8 @@ class Material:
         self.version = obj[1]
         self.name = obj[2]
         self.parent = obj[3]
-        flag_defs = obj[4]
+        # Variants refer to flags and inputs by index. Input definitions are shared between shaders.
+        flag_defs = list(obj[4].items())
         input_defs = [ShaderInput().load_minimal(i) for i in obj[5]]
 
         self.buffers = [Buffer().load_minimal(i) for i in obj[6]]
@@ -292,11 +444,7 @@ class Material:
         """
         json_path = os.path.join(path, name + Material.JSON_EXTENSION)
         with open(json_path, "w") as f:
-            json.dump(
-                self.serialize_minimal(),
-                f,
-                separators=(",", ":"),
-            )
+            util.dump_json_stream(self.serialize_minimal(stream=True), f)
 
     @classmethod
     def load_minimal_json(cls, path: str):
@@ -306,26 +454,230 @@ class Material:
         if os.path.isfile(path):
             material = cls()
             with open(path) as f:
-                material.load_minimal(pyjson5.load(f))
+                material.load_minimal(util.load_json(f))
             return material
         else:
             raise Exception(
                 f'Failed to load material json at "{path}", it\'s not a file'
             )
 
+    def store_meta(self, name: str, path: str = ".", compression=MetaCompression.none):
+        """
+        Stores minimal material properties necessary for merge source, in a compact binary format.
+        """
+        meta_path = os.path.join(path, name + Material.META_EXTENSION)
+        with open(meta_path, "wb") as f:
+            f.write(encode_meta(self.serialize_minimal(), compression))
+
     @classmethod
-    def load_bin_file(cls, path: str):
+    def load_meta_file(cls, path: str):
+        """
+        Creates a material definition from binary meta file at specified path.
+        """
+        if os.path.isfile(path):
+            material = cls()
+            with open(path, "rb") as f:
+                material.load_minimal(decode_meta(f.read()))
+            return material
+        else:
+            raise Exception(
+                f'Failed to load material meta at "{path}", it\'s not a file'
+            )
+
+    @classmethod
+    def load_merge_source_file(cls, path: str, pool: BgfxShaderPool | None = None):
+        """
+        Creates a material definition from merge source file at specified path (binary material, minimal json or meta).
+        """
+        if path.endswith(cls.EXTENSION):
+            return cls.load_bin_file(path, lazy=True, pool=pool)
+        elif path.endswith(cls.META_EXTENSION):
+            return cls.load_meta_file(path)
+        else:
+            return cls.load_minimal_json(path)
+
+    @classmethod
+    def load_bin_file(
+        cls,
+        path: str,
+        memory_map=False,
+        lazy=False,
+        pool: BgfxShaderPool | None = None,
+        max_workers=1,
+    ):
         """
         Creates a material definition from binary file at specified path.
+
+        The file is parsed from memory without intermediate copies, compiled shaders reference slices of it.
+        With `memory_map`, the file is memory-mapped instead of being read and stays mapped while the material
+        is alive, so it must not be overwritten during that time.
+        With `lazy`, compiled BGFX shaders are only parsed when they are accessed,
+        which is useful when only material metadata is needed.
+        With `pool`, compiled shaders are interned in it and don't reference the file.
+        With `max_workers` other than 1, passes are decoded concurrently in worker processes (see `read`).
         """
         if os.path.isfile(path):
             material = cls()
             with open(path, "rb") as f:
-                material.read(f)
+                if memory_map:
+                    buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                else:
+                    buffer = f.read()
+            material.read(util.MemoryReader(buffer), lazy, pool, max_workers)
             return material
         else:
             raise Exception(f'Failed to load material at "{path}", it\'s not a file')
 
+    @classmethod
+    def transcode_bin_file(
+        cls,
+        path: str,
+        outputs: list[tuple[BytesIO, int | None]],
+        clear_shaders=False,
+    ):
+        """
+        Copies binary file at specified path into outputs, see `transcode`. The file is memory-mapped while it's copied.
+        """
+        if os.path.isfile(path):
+            with open(path, "rb") as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return cls.transcode(util.MemoryReader(buffer), outputs, clear_shaders)
+        else:
+            raise Exception(f'Failed to load material at "{path}", it\'s not a file')
+
+    @classmethod
+    def scan(cls, path: str):
+        """
+        Reads metadata of binary material file at specified path: name, version, encryption, parent,
+        passes with their flags and location of every compiled shader.
+
+        Compiled shaders are skipped over by their size without being decoded, and the file is memory-mapped,
+        so most of it doesn't need to be read from disk.
+        """
+        if not os.path.isfile(path):
+            raise Exception(f'Failed to scan material at "{path}", it\'s not a file')
+
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        material = cls()
+        file = util.MemoryReader(buffer)
+        material._read_header(file)
+        file = material._decrypt(file, stream=True)
+        material._read_properties(file)
+
+        scan = MaterialScan()
+        scan.version = material.version
+        scan.name = material.name
+        scan.encryption = material.encryption
+        scan.parent = material.parent
+        scan.passes = [
+            PassScan().read(file, material.version)
+            for _ in range(util.read_ushort(file))
+        ]
+        material._validate_magic(file)
+
+        return scan
+
+    @classmethod
+    def get_index_path(cls, path: str):
+        """
+        Returns path of the index file that belongs to binary material file at specified path.
+        """
+        return path.removesuffix(cls.EXTENSION) + cls.INDEX_EXTENSION
+
+    @classmethod
+    def load_index(cls, path: str, save=False):
+        """
+        Returns shader offset index (see `Material.scan`) of binary material file at specified path.
+
+        The index is loaded from the index file next to the material if it's up to date,
+        otherwise the material is scanned. With `save`, a missing or outdated index file is (re)written.
+        """
+        stat = os.stat(path)
+        index_path = cls.get_index_path(path)
+        if os.path.isfile(index_path):
+            with open(index_path) as f:
+                obj = json.load(f)
+            if obj[:3] == [cls.INDEX_FORMAT_VERSION, stat.st_size, stat.st_mtime_ns]:
+                return MaterialScan().load_minimal(obj[3])
+
+        scan = cls.scan(path)
+        if save:
+            with open(index_path, "w") as f:
+                json.dump(
+                    [
+                        cls.INDEX_FORMAT_VERSION,
+                        stat.st_size,
+                        stat.st_mtime_ns,
+                        scan.serialize_minimal(),
+                    ],
+                    f,
+                    separators=(",", ":"),
+                )
+        return scan
+
+    @classmethod
+    def load_shader(
+        cls,
+        path: str,
+        pass_name: str,
+        flags: dict[str, str],
+        platform: ShaderPlatform,
+        stage: ShaderStage,
+        index: MaterialScan | None = None,
+    ):
+        """
+        Reads a single compiled shader from binary material file at specified path, without parsing the rest of the material.
+        Returns `None` if there is no shader with matching pass name, variant flags, platform and stage.
+
+        Shader location is looked up in `index`, or in the one returned by `Material.load_index`.
+        In encrypted materials, reading starts at the shader's counter block of the cipher,
+        so only the shader itself is decrypted (see `DecryptingReader`).
+        """
+        if index is None:
+            index = cls.load_index(path)
+
+        location = index.find_shader(pass_name, flags, platform, stage)
+        if location is None:
+            return None
+
+        with open(path, "rb") as f:
+            if index.encryption == EncryptionType.NONE:
+                f.seek(location.offset)
+                data = f.read(location.size)
+            else:
+                # Only the shader itself is decrypted.
+                material = cls()
+                material._read_header(f)
+                file = material._decrypt(f, stream=True)
+                file.seek(location.offset)
+                data = file.read(location.size)
+
+        return BgfxShader().read(util.MemoryReader(data), platform, stage)
+
+    def get_shader(
+        self,
+        pass_name: str,
+        flags: dict[str, str],
+        platform: ShaderPlatform,
+        stage: ShaderStage,
+    ):
+        """
+        Returns shader definition with matching pass name, variant flags, platform and stage, or `None` if there isn't one.
+        """
+        for shader_pass in self.passes:
+            if shader_pass.name != pass_name:
+                continue
+            for variant in shader_pass.variants:
+                if variant.flags != flags:
+                    continue
+                for shader in variant.shaders:
+                    if shader.platform == platform and shader.stage == stage:
+                        return shader
+
+        return None
+
     def load_unpacked_material(self, material_path: str):
         """
         Loads unpacked material by merging it with existing material.
@@ -334,7 +686,7 @@ class Material:
         material_json_path = os.path.join(material_path, "material.json")
         if os.path.isfile(material_json_path):
             with open(material_json_path) as f:
-                material_json: dict = pyjson5.load(f)
+                material_json: dict = util.load_json(f)
         self.version = material_json.get("version", self.version)
         self._validate_version()
 
@@ -368,12 +720,17 @@ class Material:
         # Read all json files in the folder.
         item_definitions = self._read_item_definitions(folder_path)
 
+        # Name -> first item with that name.
+        item_index = {}
+        for item in reversed(items_list):
+            item_index[item.name] = item
+
         new_items = []
         for name in item_names:
             # Find existing item in the list by name, otherwise create new one.
-            item_object = next(
-                (item for item in items_list if item.name == name), constructor()
-            )
+            item_object = item_index.get(name)
+            if item_object is None:
+                item_object = constructor()
             item_object.name = name
             if name in item_definitions:
                 item_object.load(item_definitions[name], folder_path)
@@ -398,7 +755,7 @@ class Material:
                 continue
 
             with open(file_path) as f:
-                definition: dict = pyjson5.load(f)
+                definition: dict = util.load_json(f)
 
             if "name" in definition:
                 item_definitions[definition["name"]] = definition
@@ -415,37 +772,41 @@ class Material:
         for shader_pass in self.passes:
             shader_pass.label(self.name)
 
-    def restore_varying_def(self, search_timeout: float = 10):
+    def restore_varying_def(
+        self,
+        search_timeout: float = 10,
+        condition_cache: ConditionCache | None = None,
+        search_workers: int = 1,
+    ):
         """
         Attempts to restore varying.def.sc file. Works for any platforms.
         """
         permutations: list[InputVariant] = []
         for p in self.passes:
+            # Unique inputs in order of appearance.
             per_pass_inputs: dict[
-                ShaderPlatform, dict[ShaderStage, list[ShaderInput]]
+                ShaderPlatform, dict[ShaderStage, dict[ShaderInput, None]]
             ] = {}
             for v in p.variants:
                 for s in v.shaders:
                     if s.platform not in per_pass_inputs:
                         per_pass_inputs[s.platform] = {}
                     if s.stage not in per_pass_inputs[s.platform]:
-                        per_pass_inputs[s.platform][s.stage] = []
-                    input_list = per_pass_inputs[s.platform][s.stage]
-                    for i in s.inputs:
-                        if i not in input_list:
-                            input_list.append(i)
+                        per_pass_inputs[s.platform][s.stage] = {}
+                    per_pass_inputs[s.platform][s.stage].update(dict.fromkeys(s.inputs))
 
             for platform, stage_dict in per_pass_inputs.items():
                 vertex_attributes = []
                 fragment_varyings = []
                 instance_data = []
-                for stage, inputs in stage_dict.items():
-                    inputs.sort(key=lambda x: x.name)
+                for stage, input_table in stage_dict.items():
+                    inputs = sorted(input_table, key=lambda x: x.name)
+                    name_counts = Counter(x.name for x in inputs)
                     for i in inputs:
                         is_instance_data, line = generate_varying_line(i, stage)
 
                         # This shouldn't ever happen.
-                        if len([0 for x in inputs if x.name == i.name]) != 1:
+                        if name_counts[i.name] != 1:
                             line += " // ?"
 
                         if is_instance_data:
@@ -469,7 +830,9 @@ class Material:
         if not permutations:
             return ""
 
-        return restore_varying(permutations, search_timeout)
+        return restore_varying(
+            permutations, search_timeout, condition_cache, search_workers
+        )
 
     def restore_shaders(
         self,
@@ -479,33 +842,24 @@ class Material:
         merge_stages=False,
         process_shaders=False,
         search_timeout: float = 10,
+        condition_cache: ConditionCache | None = None,
+        search_workers: int = 1,
     ) -> list[tuple[ShaderPlatform, ShaderStage, str, str]]:
         """
         Attempts to combine shader permutations into one shader (essl, glsl or metal only only).
+        Macro conditions are reused from `condition_cache` and stored in it, when it's provided.
+        All shaders share `search_timeout` seconds of slow search, which runs in up to `search_workers` processes.
         """
+        search_deadline = time.perf_counter() + search_timeout
 
         if not self.passes:
             return []
 
-        flag_definition: dict[str, set[str] | list[str]] = {}
-        passes: list[str] = []
+        flag_definition: dict[str, set[str] | list[str]] = self.get_flag_definitions()
+        passes: list[str] = [p.name for p in self.passes]
 
         restored_shaders: list[tuple[ShaderPlatform, ShaderStage, str, str]] = []
 
-        for p in self.passes:
-            passes.append(p.name)
-            for key, values in p.flag_domain.items():
-                value = values[0]  # TODO: Refactor this
-                if key in flag_definition:
-                    flag_definition[key].add(value)
-                else:
-                    flag_definition[key] = {value}
-            for v in p.variants:
-                for key, value in v.flags.items():
-                    if key in flag_definition:
-                        flag_definition[key].add(value)
-                    else:
-                        flag_definition[key] = {value}
         passes.sort()
         key_list = list(flag_definition.keys())
         key_list.sort()
@@ -567,7 +921,9 @@ class Material:
                     macros, code = restore_code(
                         code_list,
                         process_shaders=process_shaders,
-                        search_timeout=search_timeout,
+                        search_timeout=max(search_deadline - time.perf_counter(), 0),
+                        condition_cache=condition_cache,
+                        search_workers=search_workers,
                     )
                     # BGFX macros are always defined as either 0 or 1.
                     for stage_name in {"FRAGMENT", "VERTEX", "COMPUTE"}:
@@ -652,12 +1008,16 @@ class Material:
         Merges variants and passes of different materials.
         Useful when creating a single material for multiple platforms.
         """
+        # Name -> first pass with that name.
+        pass_index: dict[str, Pass] = {}
+        for shader_pass in reversed(self.passes):
+            pass_index[shader_pass.name] = shader_pass
+
         for other_pass in other.passes:
-            this_pass = next(
-                (p for p in self.passes if p.name == other_pass.name), None
-            )
+            this_pass = pass_index.get(other_pass.name)
             if this_pass is None:
                 self.passes.append(other_pass)
+                pass_index[other_pass.name] = other_pass
             else:
                 this_pass.merge_variants(other_pass)
 
@@ -0,0 +1,208 @@
+from io import BytesIO
+import os
+
+from lazurite import util
+from .platform import ShaderPlatform
+from .stage import ShaderStage
+from .encryption import EncryptionType
+from .shader_pass import Pass
+from .shader_pass.variant import Variant
+from .shader_pass.shader_definition import ShaderDefinition
+from .shader_pass.shader_input import ShaderInput
+
+
+class ShaderScan:
+    """
+    Location of a compiled shader inside of a material file.
+    """
+
+    __slots__ = ("stage", "platform", "hash", "offset", "size")
+
+    stage: ShaderStage
+    platform: ShaderPlatform
+    hash: int
+    offset: int  # Offset of encoded BGFX shader (after its length prefix).
+    size: int  # Size of encoded BGFX shader.
+
+    def __init__(self) -> None:
+        self.stage = ShaderStage.Unknown
+        self.platform = ShaderPlatform.Unknown
+        self.hash = 0
+        self.offset = 0
+        self.size = 0
+
+    def read(self, file: BytesIO, version: int):
+        definition = ShaderDefinition()
+        for _ in range(definition.read_header(file, version)):
+            ShaderInput.skip(file)
+        self.stage = definition.stage
+        self.platform = definition.platform
+
+        self.hash = util.read_ulonglong(file)
+        self.size = util.read_ulong(file)
+        self.offset = file.tell()
+        file.seek(self.size, os.SEEK_CUR)
+
+        return self
+
+    def serialize_minimal(self):
+        return [
+            self.stage.value,
+            self.platform.value,
+            self.hash,
+            self.offset,
+            self.size,
+        ]
+
+    def load_minimal(self, object: list):
+        self.stage = ShaderStage(object[0])
+        self.platform = ShaderPlatform(object[1])
+        self.hash, self.offset, self.size = object[2:5]
+        return self
+
+
+class VariantScan:
+    __slots__ = ("is_supported", "flags", "shaders")
+
+    is_supported: bool
+    flags: dict[str, str]
+    shaders: list[ShaderScan]
+
+    def __init__(self) -> None:
+        self.is_supported = False
+        self.flags = {}
+        self.shaders = []
+
+    def read(self, file: BytesIO, version: int):
+        variant = Variant()
+        shader_count = variant.read_header(file)
+        self.is_supported = variant.is_supported
+        self.flags = variant.flags
+        self.shaders = [ShaderScan().read(file, version) for _ in range(shader_count)]
+
+        return self
+
+    def serialize_minimal(self):
+        return [
+            int(self.is_supported),
+            self.flags,
+            [shader.serialize_minimal() for shader in self.shaders],
+        ]
+
+    def load_minimal(self, object: list):
+        self.is_supported = bool(object[0])
+        self.flags = object[1]
+        self.shaders = [ShaderScan().load_minimal(shader) for shader in object[2]]
+        return self
+
+
+class PassScan:
+    name: str
+    flag_domain: dict[str, list[str]]
+    variants: list[VariantScan]
+
+    def __init__(self) -> None:
+        self.name = ""
+        self.flag_domain = {}
+        self.variants = []
+
+    def read(self, file: BytesIO, version: int):
+        shader_pass = Pass().read_header(file, version)
+        self.name = shader_pass.name
+        self.flag_domain = shader_pass.flag_domain
+        self.variants = [
+            VariantScan().read(file, version) for _ in range(util.read_ushort(file))
+        ]
+
+        return self
+
+    def serialize_minimal(self):
+        return [
+            self.name,
+            self.flag_domain,
+            [variant.serialize_minimal() for variant in self.variants],
+        ]
+
+    def load_minimal(self, object: list):
+        self.name = object[0]
+        self.flag_domain = object[1]
+        self.variants = [VariantScan().load_minimal(variant) for variant in object[2]]
+        return self
+
+
+class MaterialScan:
+    """
+    Material metadata, collected without decoding compiled shaders.
+
+    Shader offsets are relative to the start of the file, or to the start of decrypted data for encrypted materials.
+    """
+
+    version: int
+    name: str
+    encryption: EncryptionType
+    parent: str
+    passes: list[PassScan]
+
+    def __init__(self) -> None:
+        self.version = 0
+        self.name = ""
+        self.encryption = EncryptionType.NONE
+        self.parent = ""
+        self.passes = []
+
+    def serialize_minimal(self):
+        return [
+            self.version,
+            self.name,
+            self.encryption.value,
+            self.parent,
+            [shader_pass.serialize_minimal() for shader_pass in self.passes],
+        ]
+
+    def load_minimal(self, object: list):
+        self.version = object[0]
+        self.name = object[1]
+        self.encryption = EncryptionType(object[2])
+        self.parent = object[3]
+        self.passes = [PassScan().load_minimal(i) for i in object[4]]
+        return self
+
+    def find_shader(
+        self,
+        pass_name: str,
+        flags: dict[str, str],
+        platform: ShaderPlatform,
+        stage: ShaderStage,
+    ) -> ShaderScan | None:
+        """
+        Returns location of the shader with matching pass name, variant flags, platform and stage, or `None` if there isn't one.
+        """
+        for shader_pass in self.passes:
+            if shader_pass.name != pass_name:
+                continue
+            for variant in shader_pass.variants:
+                if variant.flags != flags:
+                    continue
+                for shader in variant.shaders:
+                    if shader.platform == platform and shader.stage == stage:
+                        return shader
+
+        return None
+
+    def get_platforms(self):
+        platforms: set[ShaderPlatform] = set()
+        for shader_pass in self.passes:
+            for variant in shader_pass.variants:
+                for shader in variant.shaders:
+                    platforms.add(shader.platform)
+
+        return platforms
+
+    def get_stages(self):
+        stages: set[ShaderStage] = set()
+        for shader_pass in self.passes:
+            for variant in shader_pass.variants:
+                for shader in variant.shaders:
+                    stages.add(shader.stage)
+
+        return stages
@@ -0,0 +1,154 @@
+import json, lzma, struct, sys, zlib
+from array import array
+from enum import Enum
+
+
+class MetaCompression(Enum):
+    none = 0
+    zlib = 1
+    lzma = 2
+
+    def compress(self, data: bytes) -> bytes:
+        if self == MetaCompression.zlib:
+            return zlib.compress(data, 9)
+        elif self == MetaCompression.lzma:
+            return lzma.compress(data)
+        return data
+
+    def decompress(self, data: bytes | memoryview) -> bytes | memoryview:
+        if self == MetaCompression.zlib:
+            return zlib.decompress(data)
+        elif self == MetaCompression.lzma:
+            return lzma.decompress(data)
+        return data
+
+
+# Binary counterpart of minimal material json, used as a compact merge source.
+#
+# Header: magic, format version, compression.
+# Payload (compressed as a whole):
+#   - Size-prefixed strict json with everything except variants,
+#     flag definitions and input definitions act as interned string tables for variants.
+#   - Record counts, followed by fixed-width records of all passes:
+#     variants (is supported, flag count, shader count), flags (key index, value index),
+#     shaders (stage, platform, input count) and input indices.
+MAGIC = b"LZMT"
+FORMAT_VERSION = 1
+
+HEADER_CODEC = struct.Struct("<4sBB")
+COUNTS_CODEC = struct.Struct("<LLLLL")  # Json size and record counts.
+VARIANT_CODEC = struct.Struct("<?HH")
+FLAG_CODEC = struct.Struct("<HH")
+SHADER_CODEC = struct.Struct("<BBH")
+
+# Index of variants list in minimal pass json.
+_PASS_VARIANTS = 6
+
+
+def encode_meta(obj: list, compression=MetaCompression.none) -> bytes:
+    """
+    Encodes material minimal json (see `Material.serialize_minimal`) into binary meta format.
+    """
+    variant_records = bytearray()
+    flag_records = bytearray()
+    shader_records = bytearray()
+    input_indices = array("H")
+    counts = [0, 0, 0]
+
+    properties = list(obj)
+    passes = []
+    for pass_obj in obj[9]:
+        variants = pass_obj[_PASS_VARIANTS]
+        passes.append(pass_obj[:_PASS_VARIANTS] + [len(variants)])
+
+        for is_supported, flags, shaders in variants:
+            variant_records += VARIANT_CODEC.pack(
+                is_supported, len(flags), len(shaders)
+            )
+            for key_index, value_index in flags.items():
+                flag_records += FLAG_CODEC.pack(int(key_index), value_index)
+            for stage, platform, inputs in shaders:
+                shader_records += SHADER_CODEC.pack(stage, platform, len(inputs))
+                input_indices.extend(inputs)
+            counts[1] += len(flags)
+            counts[2] += len(shaders)
+        counts[0] += len(variants)
+    properties[9] = passes
+
+    if sys.byteorder == "big":
+        input_indices.byteswap()
+    properties_json = json.dumps(properties, separators=(",", ":")).encode()
+    payload = b"".join(
+        (
+            COUNTS_CODEC.pack(len(properties_json), *counts, len(input_indices)),
+            properties_json,
+            variant_records,
+            flag_records,
+            shader_records,
+            input_indices.tobytes(),
+        )
+    )
+    header = HEADER_CODEC.pack(MAGIC, FORMAT_VERSION, compression.value)
+    return header + compression.compress(payload)
+
+
+def decode_meta(data: bytes | memoryview) -> list:
+    """
+    Decodes binary meta format into material minimal json (see `Material.load_minimal`).
+    """
+    magic, format_version, compression = HEADER_CODEC.unpack_from(data)
+    if magic != MAGIC:
+        raise Exception("Failed to recognize file as material meta")
+    if format_version != FORMAT_VERSION:
+        raise Exception(
+            f"Unsupported material meta format version: {format_version}! Re-generate material meta files using current Lazurite version"
+        )
+
+    payload = memoryview(
+        MetaCompression(compression).decompress(memoryview(data)[HEADER_CODEC.size :])
+    )
+
+    json_size, variant_count, flag_count, shader_count, input_count = (
+        COUNTS_CODEC.unpack_from(payload)
+    )
+    offset = COUNTS_CODEC.size
+    properties = json.loads(bytes(payload[offset : offset + json_size]))
+    offset += json_size
+
+    # Each kind of record is read in bulk.
+    variant_records = VARIANT_CODEC.iter_unpack(
+        payload[offset : offset + variant_count * VARIANT_CODEC.size]
+    )
+    offset += variant_count * VARIANT_CODEC.size
+    flag_records = FLAG_CODEC.iter_unpack(
+        payload[offset : offset + flag_count * FLAG_CODEC.size]
+    )
+    offset += flag_count * FLAG_CODEC.size
+    shader_records = SHADER_CODEC.iter_unpack(
+        payload[offset : offset + shader_count * SHADER_CODEC.size]
+    )
+    offset += shader_count * SHADER_CODEC.size
+    input_indices = array("H")
+    input_indices.frombytes(payload[offset : offset + input_count * 2])
+    if sys.byteorder == "big":
+        input_indices.byteswap()
+    input_indices = input_indices.tolist()
+
+    input_offset = 0
+    for pass_obj in properties[9]:
+        variants = []
+        for _ in range(pass_obj[_PASS_VARIANTS]):
+            is_supported, variant_flag_count, variant_shader_count = next(
+                variant_records
+            )
+            flags = dict(next(flag_records) for _ in range(variant_flag_count))
+            shaders = []
+            for _ in range(variant_shader_count):
+                stage, platform, shader_input_count = next(shader_records)
+                inputs = input_indices[input_offset : input_offset + shader_input_count]
+                input_offset += shader_input_count
+                shaders.append([stage, platform, inputs])
+            variants.append([is_supported, flags, shaders])
+        pass_obj[_PASS_VARIANTS] = variants
+
+    return properties
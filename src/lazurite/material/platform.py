@@ -1,4 +1,5 @@
 from enum import Enum, auto
+from functools import cache
 
 
 class ShaderPlatform(Enum):
@@ -19,6 +20,7 @@ class ShaderPlatform(Enum):
     Unknown = auto()
 
     @classmethod
+    @cache
     def _platform_mapping(cls, version: int):
         if version >= 25:
             return {
@@ -6,6 +6,11 @@ import struct, os
 
 
 class BgfxUniform:
+    __slots__ = ("name", "type_bits", "count", "reg_index", "reg_count")
+
+    # Fields after the name: type bits, count, register index, register count.
+    CODEC = struct.Struct("<BBHH")
+
     name: str
     type_bits: int
     count: int
@@ -13,21 +18,30 @@ class BgfxUniform:
     reg_count: int
 
     def read(self, file: BytesIO):
-        self.name = file.read(util.read_ubyte(file)).decode()
-        self.type_bits = util.read_ubyte(file)
-        self.count = util.read_ubyte(file)
-        self.reg_index = util.read_ushort(file)
-        self.reg_count = util.read_ushort(file)
+        self.name = str(file.read(util.read_ubyte(file)), "utf-8")
+        self.type_bits, self.count, self.reg_index, self.reg_count = util.read_struct(
+            file, self.CODEC
+        )
 
         return self
 
+    def encoded_size(self) -> int:
+        """
+        Returns the size of encoded uniform in bytes.
+        """
+        return util.UBYTE.size + len(self.name.encode()) + self.CODEC.size
+
     def write(self, file: BytesIO):
         util.write_ubyte(file, len(self.name))
         file.write(self.name.encode())
-        util.write_ubyte(file, self.type_bits)
-        util.write_ubyte(file, self.count)
-        util.write_ushort(file, self.reg_index)
-        util.write_ushort(file, self.reg_count)
+        util.write_struct(
+            file,
+            self.CODEC,
+            self.type_bits,
+            self.count,
+            self.reg_index,
+            self.reg_count,
+        )
         return self
 
     def serialize_properties(self):
@@ -49,14 +63,36 @@ class BgfxUniform:
 
 
 class BgfxShader:
-    hash: int
-    uniforms: list[BgfxUniform]
-    group_size: list[int]
-    shader_bytes: bytes
-    attributes: list[int]  # Array of attribute IDs
-    size: int
+    __slots__ = (
+        "_hash",
+        "_uniforms",
+        "_group_size",
+        "_attributes",
+        "_size",
+        "_shader_bytes",
+        "_encoded",
+        "_encoded_target",
+    )
+
+    # Magic, version, hash and uniform count.
+    HEADER_CODEC = struct.Struct("<3sBLH")
+    GROUP_SIZE_CODEC = struct.Struct("<3H")
+
+    _hash: int
+    _uniforms: list[BgfxUniform]
+    _group_size: list[int]
+    _attributes: list[int]  # Array of attribute IDs
+    _size: int
+    _shader_bytes: bytes | memoryview
+
+    # Encoded shader as it was read, with the platform and stage it was read for.
+    # It's dropped once any field is modified, otherwise it's written back verbatim.
+    _encoded: bytes | memoryview | None
+    _encoded_target: tuple[ShaderPlatform, ShaderStage] | None
 
     def __init__(self) -> None:
+        self._encoded = None
+        self._encoded_target = None
         self.hash = 0
         self.uniforms = []
         self.group_size = []
@@ -64,26 +100,115 @@ class BgfxShader:
         self.attributes = []
         self.size = 0
 
+    @property
+    def hash(self) -> int:
+        return self._hash
+
+    @hash.setter
+    def hash(self, value: int):
+        self._hash = value
+        self._encoded = None
+
+    @property
+    def uniforms(self) -> list[BgfxUniform]:
+        """
+        Uniforms used by the shader. Since the list can be modified in place, accessing it marks the shader as modified.
+        """
+        self._encoded = None
+        return self._uniforms
+
+    @uniforms.setter
+    def uniforms(self, value: list[BgfxUniform]):
+        self._uniforms = value
+        self._encoded = None
+
+    @property
+    def group_size(self) -> list[int]:
+        """
+        Compute shader group size (Metal only). Accessing it marks the shader as modified.
+        """
+        self._encoded = None
+        return self._group_size
+
+    @group_size.setter
+    def group_size(self, value: list[int]):
+        self._group_size = value
+        self._encoded = None
+
+    @property
+    def attributes(self) -> list[int]:
+        """
+        Array of attribute IDs. Accessing it marks the shader as modified.
+        """
+        self._encoded = None
+        return self._attributes
+
+    @attributes.setter
+    def attributes(self, value: list[int]):
+        self._attributes = value
+        self._encoded = None
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @size.setter
+    def size(self, value: int):
+        self._size = value
+        self._encoded = None
+
+    @property
+    def shader_bytes(self) -> bytes:
+        """
+        Compiled shader code. Zero-copy slices of the source buffer are turned into owned bytes on first access.
+        """
+        if isinstance(self._shader_bytes, memoryview):
+            self._shader_bytes = self._shader_bytes.tobytes()
+        return self._shader_bytes
+
+    @shader_bytes.setter
+    def shader_bytes(self, value: bytes | memoryview):
+        self._shader_bytes = value
+        self._encoded = None
+
+    @property
+    def shader_view(self) -> memoryview:
+        """
+        Read-only view of compiled shader code, which doesn't copy it.
+        """
+        return memoryview(self._shader_bytes)
+
+    @property
+    def is_modified(self) -> bool:
+        """
+        Whether the shader has to be re-encoded when it's written, instead of being copied verbatim.
+        """
+        return self._encoded is None
+
+    def __getstate__(self):
+        # Memory views can't be pickled, so they are turned into owned bytes.
+        state = {}
+        for name in self.__slots__:
+            value = getattr(self, name)
+            state[name] = value.tobytes() if isinstance(value, memoryview) else value
+        return None, state
+
     def read(self, file: BytesIO, platform: ShaderPlatform, stage: ShaderStage):
-        header = file.read(3).decode()
+        start = file.tell()
+        header, version, self.hash, uniform_count = util.read_struct(
+            file, self.HEADER_CODEC
+        )
+        header = str(header, "utf-8")
         if not header in ["VSH", "FSH", "CSH"]:
             raise Exception(f'Unrecognized BGFX shader bin header "{header}"')
 
-        version = util.read_ubyte(file)
         if not (version == 5 or version == 3 and header == "CSH"):
             raise Exception(f"Unsupported BGFX shader bin version: {version}")
 
-        self.hash = util.read_ulong(file)
-        self.uniforms = [
-            BgfxUniform().read(file) for _ in range(util.read_ushort(file))
-        ]
+        self.uniforms = [BgfxUniform().read(file) for _ in range(uniform_count)]
 
-        if platform == ShaderPlatform.Metal and stage == ShaderStage.Compute:
-            self.group_size = [
-                util.read_ushort(file),
-                util.read_ushort(file),
-                util.read_ushort(file),
-            ]
+        if self._has_group_size(platform, stage):
+            self.group_size = list(util.read_struct(file, self.GROUP_SIZE_CODEC))
         else:
             self.group_size = []
 
@@ -92,19 +217,58 @@ class BgfxShader:
 
         attribute_count = file.read(1)
         if len(attribute_count) != 0:
-            self.attributes = [
-                util.read_ushort(file)
-                for _ in range(struct.unpack("<B", attribute_count)[0])
-            ]
+            attribute_count = attribute_count[0]
+            self.attributes = list(
+                util.read_struct(file, util.array_codec("H", attribute_count))
+            )
             self.size = util.read_ushort(file)
         else:
             self.attributes = []
             self.size = -1
 
+        if isinstance(file, util.MemoryReader):
+            self._encoded = file.buffer[start : file.tell()]
+            self._encoded_target = (platform, stage)
+
         return self
 
+    def _get_encoded(self, platform: ShaderPlatform, stage: ShaderStage):
+        if self._encoded_target == (platform, stage):
+            return self._encoded
+        return None
+
+    def _has_group_size(self, platform: ShaderPlatform, stage: ShaderStage):
+        return platform == ShaderPlatform.Metal and stage == ShaderStage.Compute
+
+    def encoded_size(self, platform: ShaderPlatform, stage: ShaderStage) -> int:
+        """
+        Returns the size of encoded shader in bytes (without its length prefix), without encoding it.
+        """
+        encoded = self._get_encoded(platform, stage)
+        if encoded is not None:
+            return len(encoded)
+
+        size = self.HEADER_CODEC.size
+        for uniform in self._uniforms:
+            size += uniform.encoded_size()
+
+        if self._has_group_size(platform, stage):
+            size += self.GROUP_SIZE_CODEC.size
+
+        size += util.ULONG.size + len(self._shader_bytes)
+        size += util.UBYTE.size  # Padding
+
+        if self._size != -1:
+            size += util.UBYTE.size + util.USHORT.size * (len(self._attributes) + 1)
+
+        return size
+
     def write(self, file: BytesIO, platform: ShaderPlatform, stage: ShaderStage):
-        bgfx_file = BytesIO()
+        # Unmodified shader is copied as it was read.
+        encoded = self._get_encoded(platform, stage)
+        if encoded is not None:
+            util.write_array(file, encoded)
+            return self
 
         header = "FSH"
         version = 5
@@ -114,42 +278,46 @@ class BgfxShader:
             header = "CSH"
             version = 3
 
-        bgfx_file.write(header.encode())
-        util.write_ubyte(bgfx_file, version)
-
-        util.write_ulong(bgfx_file, self.hash)
+        # Size is known in advance, so the shader is written directly into the output.
+        util.write_ulong(file, self.encoded_size(platform, stage))
 
-        util.write_ushort(bgfx_file, len(self.uniforms))
-        for uniform in self.uniforms:
-            uniform.write(bgfx_file)
+        util.write_struct(
+            file,
+            self.HEADER_CODEC,
+            header.encode(),
+            version,
+            self._hash,
+            len(self._uniforms),
+        )
+        for uniform in self._uniforms:
+            uniform.write(file)
 
-        if platform == ShaderPlatform.Metal and stage == ShaderStage.Compute:
-            for i in range(3):
-                util.write_ushort(bgfx_file, self.group_size[i])
+        if self._has_group_size(platform, stage):
+            util.write_struct(file, self.GROUP_SIZE_CODEC, *self._group_size[:3])
 
-        util.write_ulong(bgfx_file, len(self.shader_bytes))
-        bgfx_file.write(self.shader_bytes)
+        util.write_array(file, self._shader_bytes)
 
-        util.write_ubyte(bgfx_file, 0)  # Padding
+        util.write_ubyte(file, 0)  # Padding
 
-        if self.size != -1:
-            util.write_ubyte(bgfx_file, len(self.attributes))
-            for attribute in self.attributes:
-                util.write_ushort(bgfx_file, attribute)
+        if self._size != -1:
+            util.write_ubyte(file, len(self._attributes))
+            util.write_struct(
+                file,
+                util.array_codec("H", len(self._attributes)),
+                *self._attributes,
+            )
 
-            util.write_ushort(bgfx_file, self.size)
+            util.write_ushort(file, self._size)
 
-        bgfx_file.seek(0)
-        util.write_array(file, bgfx_file.read())
         return self
 
     def serialize_properties(self):
         obj = {}
-        obj["hash"] = self.hash
-        obj["uniforms"] = [uniform.serialize_properties() for uniform in self.uniforms]
-        obj["group_size"] = self.group_size
-        obj["attributes"] = self.attributes
-        obj["size"] = self.size
+        obj["hash"] = self._hash
+        obj["uniforms"] = [uniform.serialize_properties() for uniform in self._uniforms]
+        obj["group_size"] = self._group_size
+        obj["attributes"] = self._attributes
+        obj["size"] = self._size
         return obj
 
     def load(self, object: dict, path: str):
@@ -166,3 +334,51 @@ class BgfxShader:
             self.shader_bytes = f.read()
 
         return self
+
+
+class BgfxShaderPool:
+    """
+    Interns encoded BGFX shaders by content, so that identical shaders share one copy in memory.
+    """
+
+    shader_count: int
+    total_size: int
+
+    _shaders: dict[bytes, bytes]
+
+    def __init__(self) -> None:
+        self.shader_count = 0
+        self.total_size = 0
+        self._shaders = {}
+
+    def intern(self, data: bytes | memoryview) -> bytes:
+        """
+        Returns an owned copy of encoded shader, which is shared with all previously interned identical shaders.
+        """
+        if isinstance(data, memoryview) and not data.readonly:
+            data = data.tobytes()  # Only read-only views are hashable.
+
+        self.shader_count += 1
+        self.total_size += len(data)
+
+        shader = self._shaders.get(data)
+        if shader is None:
+            shader = bytes(data)
+            self._shaders[shader] = shader
+        return shader
+
+    @property
+    def unique_count(self) -> int:
+        return len(self._shaders)
+
+    @property
+    def unique_size(self) -> int:
+        return sum(len(shader) for shader in self._shaders)
+
+    def report(self) -> str:
+        """
+        Returns a summary of how many shaders were deduplicated.
+        """
+        duplicate_count = self.shader_count - self.unique_count
+        saved_size = self.total_size - self.unique_size
+        return f"Deduplicated {duplicate_count} of {self.shader_count} shaders, {saved_size / 1e6:.2f} MB saved"
@@ -0,0 +1,171 @@
+from array import array
+from collections.abc import Iterable
+from itertools import chain, repeat
+
+
+class FlagTable:
+    """
+    Columnar table of variant flags. Each flag key has a column with one value code per variant,
+    and codes index into a shared table of interned value strings.
+
+    The table is a snapshot, it doesn't follow later changes to the variants it was built from
+    (see `Pass.get_flag_table` for a table that is kept up to date).
+    """
+
+    MISSING = -1  # Code of a flag that variant doesn't have.
+
+    keys: list[str]
+    values: list[str]
+    codes: dict[str, int]
+    columns: dict[str, array]
+    row_count: int
+
+    _column_codes: dict[str, list[int]]
+    _masks: dict[tuple[str, int], int]
+
+    def __init__(self, flag_rows: Iterable[dict[str, str]] = ()) -> None:
+        self.keys = []
+        self.values = []
+        self.codes = {}
+        self.columns = {}
+        self._column_codes = {}
+        self._masks = {}
+
+        # Columns are built one at a time with builtins, which is much faster than appending rows.
+        rows = list(flag_rows)
+        self.row_count = len(rows)
+        for key in dict.fromkeys(chain.from_iterable(rows)):
+            column_values = list(map(dict.get, rows, repeat(key)))
+            value_codes = {
+                value: self._intern(value)
+                for value in dict.fromkeys(column_values)
+                if value is not None
+            }
+            self._column_codes[key] = list(value_codes.values())
+
+            value_codes[None] = self.MISSING
+            self.columns[key] = array(
+                "l", list(map(value_codes.__getitem__, column_values))
+            )
+            self.keys.append(key)
+
+    def __len__(self):
+        return self.row_count
+
+    def _intern(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+    def get_values(self, key: str) -> list[str]:
+        """
+        Returns values that flag key has in the table, in order of appearance.
+        """
+        return [self.values[code] for code in self._column_codes.get(key, ())]
+
+    def get_flags(self, row: int) -> dict[str, str]:
+        """
+        Returns flags of a single row.
+        """
+        return {
+            key: self.values[column[row]]
+            for key, column in self.columns.items()
+            if column[row] != self.MISSING
+        }
+
+    def get_rows(
+        self, keys: list[str], codes: dict[str, int] | None = None
+    ) -> list[tuple[int, ...]]:
+        """
+        Returns value codes of specified flag keys for every row, so that rows with the same flags are equal.
+        With `codes`, values are coded by it instead (and values that it doesn't have are added to it),
+        which makes rows of different tables comparable.
+        """
+        columns = []
+        for key in keys:
+            column = self.columns.get(key)
+            if column is None:
+                columns.append(repeat(self.MISSING, self.row_count))
+            elif codes is None:
+                columns.append(column)
+            else:
+                translation = [
+                    codes.setdefault(value, len(codes)) for value in self.values
+                ]
+                # Missing flag code -1 indexes the last item.
+                translation.append(self.MISSING)
+                columns.append(map(translation.__getitem__, column))
+
+        if not columns:
+            return [()] * self.row_count
+        return list(zip(*columns))
+
+    def get_mask(self, key: str, value: str | None) -> int:
+        """
+        Returns a bit mask of rows, in which flag key has the value. `None` value matches rows without this flag.
+        """
+        if key not in self.columns:
+            return (1 << self.row_count) - 1 if value is None else 0
+
+        code = self.MISSING if value is None else self.codes.get(value)
+        if code is None:
+            return 0
+
+        mask = self._masks.get((key, code))
+        if mask is None:
+            # Build masks for every value of the column at once, as little-endian bitmaps.
+            bitmaps: dict[int, bytearray] = {}
+            size = (self.row_count + 7) // 8
+            for row, row_code in enumerate(self.columns[key]):
+                bitmap = bitmaps.get(row_code)
+                if bitmap is None:
+                    bitmap = bitmaps[row_code] = bytearray(size)
+                bitmap[row >> 3] |= 1 << (row & 7)
+
+            masks = {
+                row_code: int.from_bytes(bitmap, "little")
+                for row_code, bitmap in bitmaps.items()
+            }
+            for row_code, row_mask in masks.items():
+                self._masks[(key, row_code)] = row_mask
+            mask = masks.get(code, 0)
+            self._masks[(key, code)] = mask
+        return mask
+
+    def select(self, **flags: str) -> list[int]:
+        """
+        Returns indices of rows that have all of the specified flag values, for example `select(Fancy="On")`.
+        """
+        mask = (1 << self.row_count) - 1
+        for key, value in flags.items():
+            mask &= self.get_mask(key, value)
+            if not mask:
+                return []
+
+        rows = []
+        while mask:
+            low_bit = mask & -mask
+            rows.append(low_bit.bit_length() - 1)
+            mask ^= low_bit
+        return rows
+
+    def group_by(self, *keys: str) -> dict[tuple[str | None, ...], list[int]]:
+        """
+        Returns indices of rows grouped by values of specified flag keys. Missing flags are grouped as `None`.
+        """
+        groups: dict[tuple[int, ...], list[int]] = {}
+        for row, group in enumerate(self.get_rows(list(keys))):
+            if group in groups:
+                groups[group].append(row)
+            else:
+                groups[group] = [row]
+
+        return {
+            tuple(
+                None if code == self.MISSING else self.values[code] for code in group
+            ): rows
+            for group, rows in groups.items()
+        }
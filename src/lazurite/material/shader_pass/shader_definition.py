@@ -1,19 +1,36 @@
 from io import BytesIO
+import struct, os
 
 from lazurite import util
 from ..platform import ShaderPlatform
 from ..stage import ShaderStage
-from .bgfx_shader import BgfxShader
+from .bgfx_shader import BgfxShader, BgfxShaderPool
 from .shader_input import ShaderInput
-import copy
 
 
 class ShaderDefinition:
+    __slots__ = (
+        "stage",
+        "platform",
+        "inputs",
+        "hash",
+        "_bgfx_shader",
+        "_bgfx_shader_data",
+        "_bgfx_shader_target",
+    )
+
+    # Stage index, platform index and input count.
+    INDEX_CODEC = struct.Struct("<BBH")
+
     stage: ShaderStage
     platform: ShaderPlatform
     inputs: list[ShaderInput]
     hash: int
-    bgfx_shader: BgfxShader
+
+    _bgfx_shader: BgfxShader | None
+    # Encoded shader of lazy mode, with the platform and stage it was read for.
+    _bgfx_shader_data: bytes | memoryview | None
+    _bgfx_shader_target: tuple[ShaderPlatform, ShaderStage] | None
 
     def __init__(self) -> None:
         self.stage = ShaderStage.Unknown
@@ -22,47 +39,165 @@ class ShaderDefinition:
         self.hash = 0
         self.bgfx_shader = BgfxShader()
 
-    def read(self, file: BytesIO, version: int):
+    @property
+    def bgfx_shader(self) -> BgfxShader:
+        """
+        Compiled BGFX shader. When definition was read in lazy mode, it's parsed from the recorded blob on first access.
+        """
+        if self._bgfx_shader is None:
+            self._bgfx_shader = BgfxShader().read(
+                util.MemoryReader(self._bgfx_shader_data), *self._bgfx_shader_target
+            )
+            self._bgfx_shader_data = None
+            self._bgfx_shader_target = None
+        return self._bgfx_shader
+
+    @bgfx_shader.setter
+    def bgfx_shader(self, value: BgfxShader):
+        self._bgfx_shader = value
+        self._bgfx_shader_data = None
+        self._bgfx_shader_target = None
+
+    def read(
+        self,
+        file: BytesIO,
+        version: int,
+        lazy=False,
+        pool: BgfxShaderPool | None = None,
+    ):
+        input_count = self.read_header(file, version)
+        self.inputs = [ShaderInput().read(file) for _ in range(input_count)]
+        self.hash = util.read_ulonglong(file)
+
+        # Encoded shader is a slice of the source buffer, lazy mode only keeps it for later.
+        bgfx_shader_data = util.read_array(file)
+        if pool is not None:
+            # Interned copy is used instead, so shader doesn't reference the source buffer.
+            bgfx_shader_data = pool.intern(bgfx_shader_data)
+        if lazy:
+            self._bgfx_shader = None
+            self._bgfx_shader_data = bgfx_shader_data
+            self._bgfx_shader_target = (self.platform, self.stage)
+        else:
+            self.bgfx_shader.read(
+                util.MemoryReader(bgfx_shader_data), self.platform, self.stage
+            )
+
+        return self
+
+    def read_header(self, file: BytesIO, version: int) -> int:
+        """
+        Reads shader stage and platform, returns the number of inputs that follow.
+        """
         self.stage = ShaderStage[util.read_string(file)]
         self.platform = ShaderPlatform[util.read_string(file)]
 
-        stage_index = util.read_ubyte(file)
+        stage_index, platform_index, input_count = util.read_struct(
+            file, self.INDEX_CODEC
+        )
         if self.stage.value != stage_index:
             raise Exception(
                 f'Stage name "{self.stage.name}" and index "{stage_index}" do not match! Index "{self.stage.value}" was expected.'
             )
 
-        platform_index = util.read_ubyte(file)
         if self.platform.get_value(version) != platform_index:
             raise Exception(
                 f'Platform name "{self.platform.name}" and index "{platform_index}" do not match! Index "{self.platform.get_value(version)}" was expected.'
             )
 
-        self.inputs = [ShaderInput().read(file) for _ in range(util.read_ushort(file))]
-        self.hash = util.read_ulonglong(file)
-        bgfx_shader_bytes = BytesIO(util.read_array(file))
-        self.bgfx_shader.read(bgfx_shader_bytes, self.platform, self.stage)
+        return input_count
 
-        return self
+    @classmethod
+    def skip(cls, file: BytesIO):
+        """
+        Moves file position past an encoded shader definition, without decoding it.
+        """
+        file.seek(util.read_ulong(file), os.SEEK_CUR)  # Stage
+        file.seek(util.read_ulong(file), os.SEEK_CUR)  # Platform
+        input_count = util.read_struct(file, cls.INDEX_CODEC)[2]
+        for _ in range(input_count):
+            ShaderInput.skip(file)
+        file.seek(util.ULONGLONG.size, os.SEEK_CUR)  # Hash
+        file.seek(util.read_ulong(file), os.SEEK_CUR)  # BGFX shader
 
-    def write(self, file: BytesIO, version: int):
-        util.write_string(file, self.stage.name)
-        util.write_string(file, self.platform.get_name(version))
-        util.write_ubyte(file, self.stage.value)
-        util.write_ubyte(file, self.platform.get_value(version))
+    @classmethod
+    def transcode(
+        cls,
+        file: BytesIO,
+        version: int,
+        outputs: list[tuple[BytesIO, int]],
+        clear_shader=False,
+    ):
+        """
+        Copies an encoded shader definition into outputs with their own versions, re-encoding only version dependent fields.
+        With `clear_shader`, compiled shader code is removed.
+        """
+        definition = cls()
+        input_count = definition.read_header(file, version)
+        for output, output_version in outputs:
+            definition.write_header(output, output_version, input_count)
+
+        # Inputs, hash and encoded shader don't depend on version.
+        start = file.tell()
+        for _ in range(input_count):
+            ShaderInput.skip(file)
+        file.seek(util.ULONGLONG.size, os.SEEK_CUR)  # Hash
+        if not clear_shader:
+            file.seek(util.read_ulong(file), os.SEEK_CUR)
+        util.copy_since(file, start, [output for output, _ in outputs])
+
+        if clear_shader:
+            shader = BgfxShader().read(
+                util.MemoryReader(util.read_array(file)),
+                definition.platform,
+                definition.stage,
+            )
+            shader.shader_bytes = b""
+            for output, _ in outputs:
+                shader.write(output, definition.platform, definition.stage)
 
-        util.write_ushort(file, len(self.inputs))
+    def write(self, file: BytesIO, version: int):
+        self.write_header(file, version, len(self.inputs))
         for inp in self.inputs:
             inp.write(file)
 
         util.write_ulonglong(file, self.hash)
-        self.bgfx_shader.write(file, self.platform, self.stage)
+        if self._bgfx_shader is None and self._bgfx_shader_target == (
+            self.platform,
+            self.stage,
+        ):
+            # Shader was never parsed, so it can't have been modified.
+            util.write_array(file, self._bgfx_shader_data)
+        else:
+            # Encoding depends on platform and stage, so it's re-encoded when either has changed.
+            self.bgfx_shader.write(file, self.platform, self.stage)
 
         return self
 
+    def write_header(self, file: BytesIO, version: int, input_count: int):
+        """
+        Writes shader stage and platform, followed by the number of inputs.
+        """
+        util.write_string(file, self.stage.name)
+        util.write_string(file, self.platform.get_name(version))
+        util.write_struct(
+            file,
+            self.INDEX_CODEC,
+            self.stage.value,
+            self.platform.get_value(version),
+            input_count,
+        )
+
     def get_shader_file_name(self, index: int):
         return f"{index}.{self.platform.name}.{self.stage.name}.{self.platform.file_extension()}"
 
+    def __getstate__(self):
+        # Memory views can't be pickled, so encoded shader is turned into owned bytes.
+        state = {name: getattr(self, name) for name in self.__slots__}
+        if isinstance(self._bgfx_shader_data, memoryview):
+            state["_bgfx_shader_data"] = self._bgfx_shader_data.tobytes()
+        return None, state
+
     def serialize_properties(self, index: int):
         obj = {}
         if index != None:
@@ -76,11 +211,11 @@ class ShaderDefinition:
         obj["bgfx_shader"] = self.bgfx_shader.serialize_properties()
         return obj
 
-    def serialize_minimal(self, input_definitions: list[ShaderInput]):
+    def serialize_minimal(self, input_indices: dict[ShaderInput, int]):
         return [
             self.stage.value,
             self.platform.value,
-            [input_definitions.index(i) for i in self.inputs],
+            [input_indices[i] for i in self.inputs],
         ]
 
     def load_minimal(
@@ -90,7 +225,8 @@ class ShaderDefinition:
     ):
         self.stage = ShaderStage(object[0])
         self.platform = ShaderPlatform(object[1])
-        self.inputs = [copy.deepcopy(input_definitions[i]) for i in object[2]]
+        # Input definitions are shared instead of copied, they are not modified in place.
+        self.inputs = [input_definitions[i] for i in object[2]]
         return self
 
     def load(self, object: dict, path: str):
@@ -1,5 +1,6 @@
 from io import BytesIO
 from enum import Enum
+import struct, os
 
 from lazurite import util
 from ..precision import Precision
@@ -30,6 +31,8 @@ class InputType(Enum):
 
 
 class InputSemantic:
+    __slots__ = ("index", "sub_index")
+
     TYPES = [
         # TODO: potentially remove is_range_allowed and remove 0 from input names if they have it. (check if compiles first??)
         # (semantic, variable_name, is_range_allowed)
@@ -58,6 +61,9 @@ class InputSemantic:
 
         return self.index == __value.index and self.sub_index == __value.sub_index
 
+    def __hash__(self) -> int:
+        return hash((self.index, self.sub_index))
+
     def get_name(self) -> str:
         name, _, is_ranged = self.TYPES[self.index]
         return name + (str(self.sub_index) if is_ranged else "")
@@ -83,6 +89,18 @@ class InputSemantic:
 
 
 class ShaderInput:
+    __slots__ = (
+        "name",
+        "type",
+        "semantic",
+        "per_instance",
+        "precision",
+        "interpolation",
+    )
+
+    # Type, semantic index, semantic sub index and per instance flag.
+    CODEC = struct.Struct("<BBB?")
+
     name: str
     type: InputType
     semantic: InputSemantic
@@ -110,11 +128,18 @@ class ShaderInput:
             and self.interpolation == __value.interpolation
         )
 
+    def __hash__(self) -> int:
+        # Inputs are hashed by value, so equal inputs can be interned and looked up in sets and dicts.
+        # Only plain fields are hashed, hashing enums is comparatively slow.
+        return hash((self.name, self.semantic.index, self.semantic.sub_index))
+
     def read(self, file):
         self.name = util.read_string(file)
-        self.type = InputType(util.read_ubyte(file))  # 0 - 4
-        self.semantic = InputSemantic(util.read_ubyte(file), util.read_ubyte(file))
-        self.per_instance = util.read_bool(file)
+        input_type, semantic_index, semantic_sub_index, self.per_instance = (
+            util.read_struct(file, self.CODEC)
+        )
+        self.type = InputType(input_type)  # 0 - 4
+        self.semantic = InputSemantic(semantic_index, semantic_sub_index)
 
         if util.read_bool(file):
             self.precision = Precision(util.read_ubyte(file))
@@ -128,12 +153,27 @@ class ShaderInput:
 
         return self
 
+    @classmethod
+    def skip(cls, file: BytesIO):
+        """
+        Moves file position past an encoded input, without decoding it.
+        """
+        file.seek(util.read_ulong(file) + cls.CODEC.size, os.SEEK_CUR)
+        if util.read_bool(file):
+            file.seek(util.UBYTE.size, os.SEEK_CUR)
+        if util.read_bool(file):
+            file.seek(util.UBYTE.size, os.SEEK_CUR)
+
     def write(self, file: BytesIO):
         util.write_string(file, self.name)
-        util.write_ubyte(file, self.type.value)
-        util.write_ubyte(file, self.semantic.index)
-        util.write_ubyte(file, self.semantic.sub_index)
-        util.write_bool(file, self.per_instance)
+        util.write_struct(
+            file,
+            self.CODEC,
+            self.type.value,
+            self.semantic.index,
+            self.semantic.sub_index,
+            self.per_instance,
+        )
 
         util.write_bool(file, self.precision != Precision.none)
         if self.precision != Precision.none:
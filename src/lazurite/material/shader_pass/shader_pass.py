@@ -1,8 +1,10 @@
 from io import BytesIO
-import os, json
+import os
 
 from lazurite import util
 from .variant import Variant
+from .bgfx_shader import BgfxShaderPool
+from .flag_table import FlagTable
 from ..platform import ShaderPlatform
 from ..stage import ShaderStage
 from .blend_mode import BlendMode
@@ -19,6 +21,10 @@ class Pass:
     output_binding_signature: int
     variants: list[Variant]
 
+    # Cached flag table, with flag dicts of variants it was built from.
+    _flag_table: FlagTable | None
+    _flag_table_rows: list[dict[str, str]]
+
     def __init__(self):
         self.name = ""
         self.supported_platforms = SupportedPlatforms()
@@ -28,7 +34,28 @@ class Pass:
         self.output_binding_signature = 0
         self.variants = []
 
-    def read(self, file: BytesIO, version: int):
+        self._flag_table = None
+        self._flag_table_rows = []
+
+    def read(
+        self,
+        file: BytesIO,
+        version: int,
+        lazy=False,
+        pool: BgfxShaderPool | None = None,
+    ):
+        self.read_header(file, version)
+        self.variants = [
+            Variant().read(file, version, lazy, pool)
+            for _ in range(util.read_ushort(file))
+        ]
+
+        return self
+
+    def read_header(self, file: BytesIO, version: int):
+        """
+        Reads pass properties that precede variants.
+        """
         self.name = util.read_string(file)
         self.supported_platforms = SupportedPlatforms().parse_bit_string(
             util.read_string(file), version
@@ -56,13 +83,48 @@ class Pass:
         if version >= 23:
             self.output_binding_signature = util.read_ulong(file)
 
-        self.variants = [
-            Variant().read(file, version) for _ in range(util.read_ushort(file))
-        ]
-
         return self
 
+    @classmethod
+    def skip(cls, file: BytesIO, version: int):
+        """
+        Moves file position past an encoded pass, without decoding its variants.
+        """
+        cls().read_header(file, version)
+        for _ in range(util.read_ushort(file)):
+            Variant.skip(file)
+
+    @classmethod
+    def transcode(
+        cls,
+        file: BytesIO,
+        version: int,
+        outputs: list[tuple[BytesIO, int]],
+        clear_shaders=False,
+    ):
+        """
+        Copies an encoded pass into outputs with their own versions, see `ShaderDefinition.transcode`.
+        """
+        shader_pass = cls().read_header(file, version)
+        variant_count = util.read_ushort(file)
+        for output, output_version in outputs:
+            shader_pass.write_header(output, output_version)
+            util.write_ushort(output, variant_count)
+
+        for _ in range(variant_count):
+            Variant.transcode(file, version, outputs, clear_shaders)
+
     def write(self, file: BytesIO, version: int):
+        self.write_header(file, version)
+        util.write_ushort(file, len(self.variants))
+        for variant in self.variants:
+            variant.write(file, version)
+        return self
+
+    def write_header(self, file: BytesIO, version: int):
+        """
+        Writes pass properties that precede variants.
+        """
         util.write_string(file, self.name)
         util.write_string(file, self.supported_platforms.get_bit_string(version))
         util.write_string(file, self.fallback_pass)
@@ -87,12 +149,9 @@ class Pass:
         if version >= 23:
             util.write_ulong(file, self.output_binding_signature)
 
-        util.write_ushort(file, len(self.variants))
-        for variant in self.variants:
-            variant.write(file, version)
         return self
 
-    def serialize_properties(self, version: int):
+    def serialize_properties(self, version: int, stream=False):
         obj = {}
         obj["name"] = self.name
         obj["supported_platforms"] = self.supported_platforms.serialize(version)
@@ -106,17 +165,19 @@ class Pass:
 
         obj["output_binding_signature"] = self.output_binding_signature
 
-        obj["variants"] = []
-        for i, variant in enumerate(self.variants):
-            obj["variants"].append(variant.serialize_properties(i))
+        variants = (
+            variant.serialize_properties(i) for i, variant in enumerate(self.variants)
+        )
+        obj["variants"] = util.JsonStream(variants) if stream else list(variants)
 
         return obj
 
     def serialize_minimal(
         self,
-        flag_definitions: dict[str, list[str]],
-        input_definitions: list[ShaderInput],
+        flag_indices: dict[str, tuple[int, dict[str, int]]],
+        input_indices: dict[ShaderInput, int],
         version: int,
+        stream=False,
     ):
         obj = [
             self.name,
@@ -131,19 +192,18 @@ class Pass:
             self.output_binding_signature,
         ]
 
-        variants = []
-        for variant in self.variants:
-            variants.append(
-                variant.serialize_minimal(flag_definitions, input_definitions)
-            )
-        obj.append(variants)
+        variants = (
+            variant.serialize_minimal(flag_indices, input_indices)
+            for variant in self.variants
+        )
+        obj.append(util.JsonStream(variants) if stream else list(variants))
 
         return obj
 
     def load_minimal(
         self,
         object: dict,
-        flag_definitions: dict[str, list[str]],
+        flag_definitions: list[tuple[str, list[str]]],
         input_definitions: list[ShaderInput],
         version: int,
     ):
@@ -168,7 +228,9 @@ class Pass:
         pass_dir = os.path.join(path, self.name)
 
         with open(os.path.join(path, f"{self.name}.json"), "w") as f:
-            json.dump(self.serialize_properties(version), f, indent=4)
+            util.dump_json_stream(
+                self.serialize_properties(version, stream=True), f, indent=4
+            )
 
         if skip_shaders:
             return self
@@ -180,7 +242,7 @@ class Pass:
                 with open(
                     os.path.join(pass_dir, shader.get_shader_file_name(i)), "wb"
                 ) as f:
-                    f.write(shader.bgfx_shader.shader_bytes)
+                    f.write(shader.bgfx_shader.shader_view)
 
         return self
 
@@ -232,12 +294,25 @@ class Pass:
         return stages
 
     def merge_variants(self, other: "Pass"):
-        for other_variant in other.variants:
-            matching_variant = next(
-                (v for v in self.variants if v.flags == other_variant.flags), None
-            )
+        # Variants are matched by rows of value codes, which both tables encode with the same codes.
+        table = self.get_flag_table()
+        other_table = other.get_flag_table()
+        keys = table.keys + [
+            key for key in other_table.keys if key not in table.columns
+        ]
+        rows = table.get_rows(keys)
+        other_rows = other_table.get_rows(keys, dict(table.codes))
+
+        # Flags -> first variant with those flags.
+        variant_index: dict[tuple[int, ...], Variant] = {}
+        for variant, flags in zip(reversed(self.variants), reversed(rows)):
+            variant_index[flags] = variant
+
+        for other_variant, flags in zip(other.variants, other_rows):
+            matching_variant = variant_index.get(flags)
             if matching_variant is None:
                 self.variants.append(other_variant)
+                variant_index[flags] = other_variant
             else:
                 matching_variant.merge_variant(other_variant)
 
@@ -247,13 +322,40 @@ class Pass:
         """
         definitions = {key: {values[0]} for key, values in self.flag_domain.items()}
 
-        for variant in self.variants:
-            for key, value in variant.flags.items():
-                if key not in definitions:
-                    definitions[key] = set()
-                definitions[key].add(value)
+        table = self.get_flag_table()
+        for key in table.keys:
+            if key not in definitions:
+                definitions[key] = set()
+            definitions[key].update(table.get_values(key))
         return definitions
 
+    def get_flag_table(self) -> FlagTable:
+        """
+        Returns a columnar table of variant flags, with rows in the same order as variants.
+        Table is cached until variants or their flag dicts are replaced, flag dicts are not expected to be modified in place.
+        """
+        rows = [variant.flags for variant in self.variants]
+        # Identical dicts compare equal without comparing their items.
+        if self._flag_table is None or rows != self._flag_table_rows:
+            self._flag_table = FlagTable(rows)
+            self._flag_table_rows = rows
+        return self._flag_table
+
+    def select(self, **flags: str):
+        """
+        Returns variants that have all of the specified flag values, for example `select(Fancy="On")`.
+        """
+        return [self.variants[i] for i in self.get_flag_table().select(**flags)]
+
+    def group_by(self, *keys: str):
+        """
+        Returns variants grouped by values of specified flag keys. Missing flags are grouped as `None`.
+        """
+        return {
+            group: [self.variants[i] for i in rows]
+            for group, rows in self.get_flag_table().group_by(*keys).items()
+        }
+
     def add_platforms(self, platforms: set[ShaderPlatform]):
         for variant in self.variants:
             variant.add_platforms(platforms)
@@ -1,15 +1,20 @@
-import copy
+import struct, os
 from io import BytesIO
 
 from lazurite import util
 from .shader_definition import ShaderDefinition
+from .bgfx_shader import BgfxShaderPool
 from ..platform import ShaderPlatform
 from ..stage import ShaderStage
-from .bgfx_shader import BgfxShader
 from .shader_input import ShaderInput
 
 
 class Variant:
+    __slots__ = ("is_supported", "flags", "shaders")
+
+    # Is supported flag, flag count and shader count.
+    HEADER_CODEC = struct.Struct("<?HH")
+
     is_supported: bool
     flags: dict[str, str]
     shaders: list[ShaderDefinition]
@@ -19,26 +24,74 @@ class Variant:
         self.flags = {}
         self.shaders = []
 
-    def read(self, file: BytesIO, version: int):
-        self.is_supported = util.read_bool(file)
-        flag_count = util.read_ushort(file)
-        shader_count = util.read_ushort(file)
+    def read(
+        self,
+        file: BytesIO,
+        version: int,
+        lazy=False,
+        pool: BgfxShaderPool | None = None,
+    ):
+        shader_count = self.read_header(file)
+        self.shaders = [
+            ShaderDefinition().read(file, version, lazy, pool)
+            for _ in range(shader_count)
+        ]
+
+        return self
+
+    def read_header(self, file: BytesIO) -> int:
+        """
+        Reads is supported flag and variant flags, returns the number of shaders that follow.
+        """
+        self.is_supported, flag_count, shader_count = util.read_struct(
+            file, self.HEADER_CODEC
+        )
 
         self.flags = {}
         for _ in range(flag_count):
             key = util.read_string(file)
             self.flags[key] = util.read_string(file)
 
-        self.shaders = [
-            ShaderDefinition().read(file, version) for _ in range(shader_count)
-        ]
+        return shader_count
+
+    @classmethod
+    def skip(cls, file: BytesIO):
+        """
+        Moves file position past an encoded variant, without decoding its shaders.
+        """
+        _, flag_count, shader_count = util.read_struct(file, cls.HEADER_CODEC)
+        for _ in range(flag_count * 2):
+            file.seek(util.read_ulong(file), os.SEEK_CUR)
+        for _ in range(shader_count):
+            ShaderDefinition.skip(file)
+
+    @classmethod
+    def transcode(
+        cls,
+        file: BytesIO,
+        version: int,
+        outputs: list[tuple[BytesIO, int]],
+        clear_shaders=False,
+    ):
+        """
+        Copies an encoded variant into outputs with their own versions, see `ShaderDefinition.transcode`.
+        """
+        # Variant header doesn't depend on version.
+        start = file.tell()
+        shader_count = cls().read_header(file)
+        util.copy_since(file, start, [output for output, _ in outputs])
 
-        return self
+        for _ in range(shader_count):
+            ShaderDefinition.transcode(file, version, outputs, clear_shaders)
 
     def write(self, file: BytesIO, version: int):
-        util.write_bool(file, self.is_supported)
-        util.write_ushort(file, len(self.flags))
-        util.write_ushort(file, len(self.shaders))
+        util.write_struct(
+            file,
+            self.HEADER_CODEC,
+            self.is_supported,
+            len(self.flags),
+            len(self.shaders),
+        )
 
         for key in self.flags:
             util.write_string(file, key)
@@ -59,31 +112,32 @@ class Variant:
 
     def serialize_minimal(
         self,
-        flag_definitions: dict[str, list[str]],
-        input_definitions: list[ShaderInput],
+        flag_indices: dict[str, tuple[int, dict[str, int]]],
+        input_indices: dict[ShaderInput, int],
     ):
+        flags = {}
+        for key, value in self.flags.items():
+            key_index, value_indices = flag_indices[key]
+            flags[key_index] = value_indices[value]
+
         return [
             int(self.is_supported),
-            {
-                list(flag_definitions.keys()).index(x): flag_definitions[x].index(y)
-                for x, y in self.flags.items()
-            },
-            [shader.serialize_minimal(input_definitions) for shader in self.shaders],
+            flags,
+            [shader.serialize_minimal(input_indices) for shader in self.shaders],
         ]
 
     def load_minimal(
         self,
         object: list,
-        flag_definitions: dict[str, list[str]],
+        flag_definitions: list[tuple[str, list[str]]],
         input_definitions: list[ShaderInput],
     ):
         self.is_supported = bool(object[0])
 
-        flag_keys = list(flag_definitions.keys())
-        self.flags = {
-            flag_keys[int(x)]: flag_definitions[flag_keys[int(x)]][y]
-            for x, y in object[1].items()
-        }
+        self.flags = {}
+        for key_index, value_index in object[1].items():
+            key, values = flag_definitions[int(key_index)]
+            self.flags[key] = values[value_index]
 
         self.shaders = [
             ShaderDefinition().load_minimal(shader, input_definitions)
@@ -124,18 +178,12 @@ class Variant:
         return stages
 
     def merge_variant(self, other: "Variant"):
+        shader_keys = {(shader.platform, shader.stage) for shader in self.shaders}
         for other_shader in other.shaders:
-            matching_shader = next(
-                (
-                    v
-                    for v in self.shaders
-                    if v.platform == other_shader.platform
-                    and v.stage == other_shader.stage
-                ),
-                None,
-            )
-            if matching_shader is None:
+            key = (other_shader.platform, other_shader.stage)
+            if key not in shader_keys:
                 self.shaders.append(other_shader)
+                shader_keys.add(key)
 
     def add_platforms(self, platforms: set[ShaderPlatform]):
         current_platforms = self.get_platforms()
@@ -144,13 +192,14 @@ class Variant:
 
         for platform in missing_platforms:
             for stage in stages:
-                shader = next(
-                    (x for x in self.shaders if x.stage == stage), ShaderDefinition()
-                )
-                shader = copy.deepcopy(shader)
+                template = next((x for x in self.shaders if x.stage == stage), None)
+                shader = ShaderDefinition()
                 shader.stage = stage
                 shader.platform = platform
-                shader.bgfx_shader = BgfxShader()
+                # Only metadata is copied, compiled shader is replaced with an empty one anyway.
+                if template is not None:
+                    shader.inputs = list(template.inputs)
+                    shader.hash = template.hash
                 self.shaders.append(shader)
 
     def remove_platforms(self, platforms: set[ShaderPlatform]):
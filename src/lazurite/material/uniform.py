@@ -13,6 +13,10 @@ class UniformType(Enum):
 
 
 class Uniform:
+    __slots__ = ("name", "type", "count", "default")
+
+    # Array count and whether default value is present.
+    ARRAY_CODEC = struct.Struct("<L?")
 
     name: str
     type: UniformType
@@ -31,20 +35,19 @@ class Uniform:
 
         self.default = []
         if 2 <= self.type.value <= 4:
-            self.count = util.read_ulong(file)
-            hasData = util.read_bool(file)
+            self.count, hasData = util.read_struct(file, self.ARRAY_CODEC)
 
         if self.type.value == 2:  # vec4
             if hasData:
-                self.default = struct.unpack("<" + 4 * "f", file.read(4 * 4))
+                self.default = util.read_struct(file, util.array_codec("f", 4))
 
         elif self.type.value == 3:  # mat3
             if hasData:
-                self.default = struct.unpack("<" + 9 * "f", file.read(4 * 9))
+                self.default = util.read_struct(file, util.array_codec("f", 9))
 
         elif self.type.value == 4:  # mat4
             if hasData:
-                self.default = struct.unpack("<" + 16 * "f", file.read(4 * 16))
+                self.default = util.read_struct(file, util.array_codec("f", 16))
 
         elif self.type.value == 5:  # external
             pass
@@ -59,11 +62,12 @@ class Uniform:
         util.write_ushort(file, self.type.value)
 
         if 2 <= self.type.value <= 4:
-            util.write_ulong(file, self.count)
-            util.write_bool(file, len(self.default) > 0)
+            util.write_struct(file, self.ARRAY_CODEC, self.count, len(self.default) > 0)
 
         if len(self.default) > 0:
-            file.write(struct.pack("<" + "f" * len(self.default), *self.default))
+            util.write_struct(
+                file, util.array_codec("f", len(self.default)), *self.default
+            )
 
         return self
 
@@ -1,4 +1,5 @@
-import pyjson5, copy, os
+import copy, os
+from lazurite import util
 from .compiler_type import CompilerType
 from lazurite.compiler.macro_define import MacroDefine
 from .shader_file_overwrite import ShaderFileOverwrite
@@ -28,7 +29,7 @@ class MaterialConfig:
             return
 
         with open(file_path) as f:
-            mat_json = pyjson5.load(f)
+            mat_json = util.load_json(f)
         self.read_json(mat_json)
 
     def read_json(self, json_data: dict):
@@ -1,4 +1,4 @@
-import os, pyjson5, pcpp, pathlib, sys
+import os, pcpp, pathlib, sys
 from concurrent.futures import ThreadPoolExecutor
 
 # Try importing optional dependency.
@@ -21,47 +21,57 @@ from lazurite.compiler.macro_define import MacroDefine
 from lazurite.material.shader_pass import Pass
 from lazurite.material.shader_pass.variant import Variant
 from lazurite.material.shader_pass.shader_definition import ShaderDefinition
+from lazurite.material.shader_pass.bgfx_shader import BgfxShaderPool
 from lazurite.tempfile import CustomTempFile
 from lazurite.compiler.glslang import Glslang
 
+# {path: (name, {platforms}, material that was loaded while scanning and wasn't used yet)}
+MergeSourceCache = dict[str, tuple[str, set[ShaderPlatform], Material | None]]
+
+
+def _scan_merge_source(path: str) -> tuple[str, set[ShaderPlatform], Material | None]:
+    # Binary materials are only scanned, they are loaded after they are known to match.
+    if path.endswith(Material.EXTENSION):
+        scan = Material.scan(path)
+        return scan.name, scan.get_platforms(), None
+
+    # Other formats have to be loaded as a whole, so loaded material is kept for its first use.
+    material = Material.load_merge_source_file(path)
+    return material.name, material.get_platforms(), material
+
+
+def _load_merge_source(path: str, cache: MergeSourceCache, pool: BgfxShaderPool):
+    if path.endswith(Material.EXTENSION):
+        return Material.load_merge_source_file(path, pool)
+
+    # Materials are modified after they are merged, so cached material is only used once.
+    name, platforms, material = cache[path]
+    if material is None:
+        material = Material.load_merge_source_file(path)
+    else:
+        cache[path] = name, platforms, None
+    return material
+
 
 def _merge_source_by_name(
     name: str,
     platforms: list[ShaderPlatform],
     merge_source: list[str],
-    cache: dict[str, tuple[str, set[ShaderPlatform]]],
+    cache: MergeSourceCache,
+    pool: BgfxShaderPool,
 ):
     mat = None
     for platform in platforms:
         for path in merge_source:
-            is_binary_file = path.endswith(Material.EXTENSION)
-            found_platform = False
-            if path in cache:
-                cache_name, cache_platforms = cache[path]
-                if cache_name == name and platform in cache_platforms:
-                    found_platform = True
-                    if is_binary_file:
-                        temp_mat = Material.load_bin_file(path)
-                    else:
-                        temp_mat = Material.load_minimal_json(path)
-                    if mat is None:
-                        mat = temp_mat
-                    else:
-                        mat.merge_variants(temp_mat)
-            else:
-                if is_binary_file:
-                    temp_mat = Material.load_bin_file(path)
+            if path not in cache:
+                cache[path] = _scan_merge_source(path)
+            cache_name, cache_platforms, _ = cache[path]
+            if cache_name == name and platform in cache_platforms:
+                temp_mat = _load_merge_source(path, cache, pool)
+                if mat is None:
+                    mat = temp_mat
                 else:
-                    temp_mat = Material.load_minimal_json(path)
-                mat_platforms = temp_mat.get_platforms()
-                if temp_mat.name == name and platform in mat_platforms:
-                    found_platform = True
-                    if mat is None:
-                        mat = temp_mat
-                    else:
-                        mat.merge_variants(temp_mat)
-                cache[path] = (temp_mat.name, mat_platforms)
-            if found_platform:
+                    mat.merge_variants(temp_mat)
                 break
     return mat
 
@@ -70,45 +80,24 @@ def _merge_source_by_path(
     name: str,
     platforms: list[ShaderPlatform],
     merge_source: list[str],
-    cache: dict[str, tuple[str, set[ShaderPlatform]]],
+    cache: MergeSourceCache,
+    pool: BgfxShaderPool,
 ):
     mat = None
     for platform in platforms:
         for path in merge_source:
             if os.path.basename(path) not in (
-                name + ext for ext in (Material.EXTENSION, Material.JSON_EXTENSION)
+                name + ext for ext in Material.MERGE_SOURCE_EXTENSIONS
             ):
                 continue
-            is_binary_file = path.endswith(Material.EXTENSION)
-            found_platform = False
-            if path in cache:
-                if platform in cache[path][1]:
-                    found_platform = True
-
-                    if is_binary_file:
-                        temp_mat = Material.load_bin_file(path)
-                    else:
-                        temp_mat = Material.load_minimal_json(path)
-
-                    if mat is None:
-                        mat = temp_mat
-                    else:
-                        mat.merge_variants(temp_mat)
-            else:
-                if is_binary_file:
-                    temp_mat = Material.load_bin_file(path)
+            if path not in cache:
+                cache[path] = _scan_merge_source(path)
+            if platform in cache[path][1]:
+                temp_mat = _load_merge_source(path, cache, pool)
+                if mat is None:
+                    mat = temp_mat
                 else:
-                    temp_mat = Material.load_minimal_json(path)
-
-                mat_platforms = temp_mat.get_platforms()
-                if platform in mat_platforms:
-                    found_platform = True
-                    if mat is None:
-                        mat = temp_mat
-                    else:
-                        mat.merge_variants(temp_mat)
-                cache[path] = (temp_mat.name, mat_platforms)
-            if found_platform:
+                    mat.merge_variants(temp_mat)
                 break
     return mat
 
@@ -117,22 +106,27 @@ def _merge_source_materials(
     mat_dir: os.DirEntry,
     platforms: list[ShaderPlatform],
     merge_source: list[str],
-    material_cache: dict[str, tuple[str, set[ShaderPlatform]]],
+    material_cache: MergeSourceCache,
+    pool: BgfxShaderPool,
 ):
     name = mat_dir.name
     use_name = False
     path = os.path.join(mat_dir, "material.json")
     if os.path.isfile(path):
         with open(path) as f:
-            json_data = pyjson5.load(f)
+            json_data = util.load_json(f)
         if "name" in json_data:
             name = json_data["name"]
             use_name = True
 
     if use_name:
-        return _merge_source_by_name(name, platforms, merge_source, material_cache)
+        return _merge_source_by_name(
+            name, platforms, merge_source, material_cache, pool
+        )
     else:
-        return _merge_source_by_path(name, platforms, merge_source, material_cache)
+        return _merge_source_by_path(
+            name, platforms, merge_source, material_cache, pool
+        )
 
 
 # TODO: add uniform array count macro
@@ -323,8 +317,7 @@ def compile(
 
     moderngl_validate = validate and "moderngl" in sys.modules
 
-    # {path: (name, {platforms})}
-    material_cache: dict[str, tuple[str, set[ShaderPlatform]]] = {}
+    material_cache: MergeSourceCache = {}
 
     for mat_dir in _get_material_folders(proj_config, project_path):
         shaders: list[ShaderDefinition] = []
@@ -346,9 +339,15 @@ def compile(
         )
 
         # Load and merge vanilla target platform materials.
+        # Shaders that are identical between merge sources are only kept in memory once.
+        pool = BgfxShaderPool()
         material = (
             _merge_source_materials(
-                mat_dir, proj_config.platforms, proj_config.merge_source, material_cache
+                mat_dir,
+                proj_config.platforms,
+                proj_config.merge_source,
+                material_cache,
+                pool,
             )
             or Material()
         )
@@ -361,6 +360,7 @@ def compile(
                 set(ShaderPlatform),
                 proj_config.merge_source,
                 material_cache,
+                pool,
             )
 
             if temp_mat:
@@ -370,6 +370,9 @@ def compile(
                 # but merge_source in project config is not empty.
                 print(f"Warning! Failed to find merge source for {mat_dir.name}")
 
+        if pool.unique_count < pool.shader_count:
+            print(pool.report())
+
         material.add_platforms(compilable_platforms)
         material.remove_platforms(set(ShaderPlatform).difference(project_platforms))
 
@@ -469,7 +472,7 @@ def compile(
             for variant in shader_pass.variants:
                 new_shaders = []
                 for shader in variant.shaders:
-                    if shader.bgfx_shader.shader_bytes:
+                    if shader.bgfx_shader.shader_view:
                         new_shaders.append(shader)
                 variant.shaders = new_shaders
 
@@ -1,7 +1,8 @@
-import os, pyjson5
+import os
 from collections.abc import Callable
 from typing import Any
 
+from lazurite import util
 from lazurite.material import Material
 from lazurite.material.shader_pass.shader_definition import ShaderPlatform
 from lazurite.compiler.macro_define import MacroDefine
@@ -27,7 +28,7 @@ class ProjectConfig:
         if not os.path.isfile(path):
             return
         with open(path) as f:
-            json_data = pyjson5.load(f)
+            json_data = util.load_json(f)
         project_folder = os.path.split(path)[0]
 
         properties: list[tuple[list, str, Callable[[Any], list]]] = [
@@ -101,7 +102,7 @@ class ProjectConfig:
             if (
                 os.path.isfile(merge_path)
                 and merge_path not in new_merge_source
-                and merge_path.endswith((Material.EXTENSION, Material.JSON_EXTENSION))
+                and merge_path.endswith(Material.MERGE_SOURCE_EXTENSIONS)
             ):
                 new_merge_source.append(merge_path)
             elif os.path.isdir(merge_path):
@@ -109,9 +110,7 @@ class ProjectConfig:
                     if (
                         mat_dir.is_file()
                         and mat_dir.path not in new_merge_source
-                        and mat_dir.path.endswith(
-                            (Material.EXTENSION, Material.JSON_EXTENSION)
-                        )
+                        and mat_dir.path.endswith(Material.MERGE_SOURCE_EXTENSIONS)
                     ):
                         new_merge_source.append(mat_dir.path)
             else:
@@ -1,76 +1,148 @@
 from io import BytesIO
+from collections import Counter
+from collections.abc import Iterable
 from functools import cache
 import struct
+import os
+import sys
 import re
+import json
+import pyjson5
 
 from lazurite.material.platform import ShaderPlatform
 
 
+class MemoryReader:
+    """
+    File-like reader over an in-memory buffer (bytes, mmap, memoryview).
+    Reads return zero-copy memoryview slices of the underlying buffer, instead of copying data into new bytes objects.
+    """
+
+    buffer: memoryview
+    offset: int
+
+    def __init__(self, buffer, offset: int = 0):
+        self.buffer = memoryview(buffer)
+        self.offset = offset
+
+    def read(self, size: int = -1) -> memoryview:
+        start = self.offset
+        data = self.buffer[start : start + size] if size >= 0 else self.buffer[start:]
+        self.offset = start + len(data)
+        return data
+
+    def tell(self) -> int:
+        return self.offset
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self.offset
+        elif whence == os.SEEK_END:
+            offset += len(self.buffer)
+        self.offset = offset
+        return self.offset
+
+
+# Precompiled struct codecs.
+ULONGLONG = struct.Struct("<Q")
+ULONG = struct.Struct("<L")
+BOOL = struct.Struct("<?")
+UBYTE = struct.Struct("<B")
+USHORT = struct.Struct("<H")
+
+
+@cache
+def array_codec(item_format: str, count: int) -> struct.Struct:
+    """
+    Returns a precompiled struct codec for a run of `count` values of the same type.
+    """
+    return struct.Struct(f"<{count}{item_format}")
+
+
+def read_struct(f: BytesIO, codec: struct.Struct) -> tuple:
+    """
+    Reads a fixed-size run of values with a precompiled struct codec.
+    """
+    if isinstance(f, MemoryReader):
+        # Unpack directly from the buffer, without slicing it.
+        offset = f.offset
+        f.offset = offset + codec.size
+        return codec.unpack_from(f.buffer, offset)
+    return codec.unpack(f.read(codec.size))
+
+
+def write_struct(f: BytesIO, codec: struct.Struct, *values):
+    """
+    Writes a fixed-size run of values with a precompiled struct codec.
+    """
+    f.write(codec.pack(*values))
+
+
 # Reading binary files.
 def read_ulonglong(f: BytesIO) -> int:
     """8 bytes"""
-    return struct.unpack("<Q", f.read(8))[0]
+    return read_struct(f, ULONGLONG)[0]
 
 
 def read_ulong(f: BytesIO) -> int:
     """4 bytes"""
-    return struct.unpack("<L", f.read(4))[0]
+    return read_struct(f, ULONG)[0]
 
 
 def read_bool(f: BytesIO) -> bool:
     """1 byte"""
-    return struct.unpack("<?", f.read(1))[0]
+    return read_struct(f, BOOL)[0]
 
 
 def read_ubyte(f: BytesIO) -> int:
     """1 byte"""
-    return struct.unpack("<B", f.read(1))[0]
+    return read_struct(f, UBYTE)[0]
 
 
 def read_ushort(f: BytesIO) -> int:
     """2 bytes"""
-    return struct.unpack("<H", f.read(2))[0]
+    return read_struct(f, USHORT)[0]
 
 
-def read_array(f: BytesIO) -> bytes:
+def read_array(f: BytesIO) -> bytes | memoryview:
     """4 bytes length, N-byte array"""
-    return f.read(struct.unpack("<I", f.read(4))[0])
+    return f.read(read_struct(f, ULONG)[0])
 
 
 def read_string(f: BytesIO) -> str:
     """4 bytes length, N-byte string"""
-    return read_array(f).decode()
+    return str(read_array(f), "utf-8")
 
 
 # Writing binary files.
 def write_ulonglong(f: BytesIO, val: int):
     """8 bytes"""
-    f.write(struct.pack("<Q", val))
+    f.write(ULONGLONG.pack(val))
 
 
 def write_ulong(f: BytesIO, val: int):
     """4 bytes"""
-    f.write(struct.pack("<L", val))
+    f.write(ULONG.pack(val))
 
 
 def write_bool(f: BytesIO, val: bool):
     """1 byte"""
-    f.write(struct.pack("<?", val))
+    f.write(BOOL.pack(val))
 
 
 def write_ubyte(f: BytesIO, val: int):
     """1 byte"""
-    f.write(struct.pack("<B", val))
+    f.write(UBYTE.pack(val))
 
 
 def write_ushort(f: BytesIO, val: int):
     """2 bytes"""
-    f.write(struct.pack("<H", val))
+    f.write(USHORT.pack(val))
 
 
-def write_array(f: BytesIO, val: bytes):
+def write_array(f: BytesIO, val: bytes | memoryview):
     """4 bytes length, N-byte array"""
-    f.write(struct.pack("<I", len(val)))
+    f.write(ULONG.pack(len(val)))
     f.write(val)
 
 
@@ -79,6 +151,132 @@ def write_string(f: BytesIO, val: str):
     write_array(f, val.encode())
 
 
+def copy_since(f: BytesIO, start: int, outputs: list[BytesIO]):
+    """Copies bytes from start position up to current position into each output"""
+    end = f.tell()
+    f.seek(start)
+    data = f.read(end - start)
+    for output in outputs:
+        output.write(data)
+
+
+def get_cache_dir() -> str:
+    """
+    Returns a directory for persistent Lazurite caches, in the user cache directory of the platform.
+    """
+    if sys.platform == "win32":
+        base_dir = os.environ.get("LOCALAPPDATA") or os.path.expanduser(
+            "~/AppData/Local"
+        )
+    elif sys.platform == "darwin":
+        base_dir = os.path.expanduser("~/Library/Caches")
+    else:
+        base_dir = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base_dir, "lazurite")
+
+
+# Reading json files.
+JSON_LOAD_COUNTS: Counter[str] = Counter()  # Number of files loaded by each parser.
+
+
+def load_json(f: BytesIO):
+    """
+    Loads json from a text file. Strict json is parsed with fast built-in parser,
+    falling back to lenient pyjson5 parser for files with comments, trailing commas etc.
+    """
+    text = f.read()
+    try:
+        data = json.loads(text)
+        JSON_LOAD_COUNTS["json"] += 1
+    except ValueError:
+        data = pyjson5.loads(text)
+        JSON_LOAD_COUNTS["json5"] += 1
+    return data
+
+
+def get_json_load_report() -> str:
+    """
+    Returns a summary of how many json files were loaded by each parser.
+    """
+    strict_count = JSON_LOAD_COUNTS["json"]
+    lenient_count = JSON_LOAD_COUNTS["json5"]
+    return f"Loaded {strict_count + lenient_count} json files ({strict_count} strict, {lenient_count} with json5 fallback)"
+
+
+# Writing json files.
+class JsonStream:
+    """
+    Json array, whose items are produced and written one at a time by `dump_json_stream`, instead of being kept in memory.
+    """
+
+    __slots__ = ("items",)
+
+    items: Iterable
+
+    def __init__(self, items: Iterable) -> None:
+        self.items = items
+
+
+def _has_stream(value) -> bool:
+    if isinstance(value, dict):
+        value = value.values()
+    elif not isinstance(value, (list, tuple)):
+        return False
+    return any(isinstance(item, JsonStream) for item in value)
+
+
+def dump_json_stream(obj, f: BytesIO, indent: int | None = None):
+    """
+    Writes json to a text file with the same output as `json.dump` (with compact separators when there is no indent),
+    but items of `JsonStream` arrays are written as soon as they are produced.
+    A stream is only found if it's the top level value, or a direct child of a list or dict, which is found the same way.
+    """
+    if indent is None:
+        encoder = json.JSONEncoder(separators=(",", ":"))
+        item_separator, key_separator = ",", ":"
+    else:
+        encoder = json.JSONEncoder(indent=indent)
+        item_separator, key_separator = ",", ": "
+
+    def write(value, level: int):
+        if isinstance(value, JsonStream):
+            brackets = "[]"
+            items = ((None, item) for item in value.items)
+        elif _has_stream(value):
+            if isinstance(value, dict):
+                brackets = "{}"
+                items = value.items()
+            else:
+                brackets = "[]"
+                items = ((None, item) for item in value)
+        else:
+            # Nested values are encoded as a whole, re-indented to the current level.
+            encoded = encoder.encode(value)
+            if indent and level:
+                encoded = encoded.replace("\n", "\n" + " " * (indent * level))
+            f.write(encoded)
+            return
+
+        is_empty = True
+        for key, item in items:
+            f.write(brackets[0] if is_empty else item_separator)
+            is_empty = False
+            if indent is not None:
+                f.write("\n" + " " * (indent * (level + 1)))
+            if key is not None:
+                f.write(encoder.encode(str(key)) + key_separator)
+            write(item, level + 1)
+
+        if is_empty:
+            f.write(brackets)
+            return
+        if indent is not None:
+            f.write("\n" + " " * (indent * level))
+        f.write(brackets[1])
+
+    write(obj, 0)
+
+
 def format_definition_name(name: str):
     # aA -> a_A
     name = re.sub(r"([a-z]+)([A-Z])", r"\1_\2", name)